@@ -0,0 +1,49 @@
+import subprocess, json, sys
+import pytest
+
+from conftest import ROOT_PATH, UPDATE_BASELINE, read_baseline, write_baseline
+
+# entry points of the web app, the background jobs and the preprocessing CLI's
+ENTRY_POINTS = ['main', 'serve', 'lib.etl', 'lib.jobs', 'lib.queries', 'lib.features', 'lib.transformers', 'lib.usagepoints', 'lib.enrich']
+
+# optional dependencies which must only be executed on first use
+HEAVY_MODULES = ['matplotlib', 'pandas', 'plotly.express', 'plotly.subplots', 'lxml', 'pydantic', 'dotenv']
+
+# allowed slowdown against the baseline before an import counts as regression, the slack absorbs the jitter of
+# interpreter start-up on small runners
+IMPORT_TIME_TOLERANCE = 1.5
+IMPORT_TIME_SLACK = 0.15
+
+# fresh interpreters per module, the fastest import is compared
+REPEAT = 5
+
+PROBE = '''
+import sys, time, json
+t0 = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t0
+loaded = [name for name in {heavy} if name in sys.modules]
+print(json.dumps({{'elapsed': elapsed, 'loaded': loaded}}))
+'''
+
+
+# import time and eagerly executed heavy modules of {module} in a fresh interpreter
+def probe(module: str) -> dict:
+    result = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                            cwd=ROOT_PATH, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize('module', ENTRY_POINTS)
+def bench_import(module: str):
+    results = [probe(module) for _ in range(REPEAT)]
+    elapsed = min(result['elapsed'] for result in results)
+
+    assert results[0]['loaded'] == [], f"import {module} eagerly loads {results[0]['loaded']}"
+
+    baseline = read_baseline('imports')
+    if UPDATE_BASELINE:
+        write_baseline('imports', {**baseline, module: round(elapsed, 4)})
+    elif module in baseline:
+        budget = baseline[module]*IMPORT_TIME_TOLERANCE + IMPORT_TIME_SLACK
+        assert elapsed <= budget, f"import {module} took {elapsed:.3f}s, budget {budget:.3f}s (baseline {baseline[module]:.3f}s)"
@@ -0,0 +1,62 @@
+import polars as pl
+import pytest
+import os
+
+from conftest import SIZES, measure, stub_price_area
+from synthetic import bronze_measurements, bulk_response, DATE_FROM, DATE_TO, time_format
+
+import lib.etl, lib.features
+from lib import DATA_PATH
+from lib.timeseries import timeseries
+from lib.api import BulkResponse, SAMPLES_PER_BATCH_LIMIT
+
+
+# bronze measurements as prepared by the bronze to silver ETL before the timeseries extraction
+def prepared_measurements(meter_cnt: int) -> pl.DataFrame:
+    return (bronze_measurements(meter_cnt)
+            .with_columns(pl.col('fromTime').str.to_datetime(format=time_format),
+                          pl.col('toTime').str.to_datetime(format=time_format),
+                          topology=pl.lit('synthetic'))
+            .sort(by='fromTime'))
+
+
+@pytest.mark.parametrize('meter_cnt', SIZES)
+def bench_timeseries(benchmark, meter_cnt: int):
+    df = prepared_measurements(meter_cnt)
+
+    df_silver = measure(benchmark, 'pipeline', f"timeseries[{meter_cnt}]",
+                        lambda: timeseries(df_topology=df, date_from=DATE_FROM, date_to=DATE_TO), meter_cnt)
+    assert df_silver.n_unique('meteringPointId') == meter_cnt
+
+
+# silver build of a topology from bronze including the rollups and the catalog update
+@pytest.mark.parametrize('meter_cnt', SIZES)
+def bench_bronze_to_silver(benchmark, lake, meter_cnt: int):
+    topology = lake[meter_cnt]
+    silver_file = os.path.join(DATA_PATH, 'silver', topology)
+
+    def remove_silver():
+        os.remove(silver_file)
+
+    measure(benchmark, 'pipeline', f"bronze_to_silver[{meter_cnt}]",
+            lambda: lib.etl.etl_bronze_to_silver(topology, DATE_FROM.strftime(time_format), DATE_TO.strftime(time_format)),
+            meter_cnt, setup=remove_silver)
+    assert os.path.isfile(silver_file)
+
+
+# feature table of the topologies of all sizes with silver in place, the preprocessing covers the whole data lake
+def bench_features(benchmark, monkeypatch, lake: dict):
+    stub_price_area(monkeypatch)
+
+    measure(benchmark, 'pipeline', f"features[{','.join(map(str, SIZES))}]", lib.features.preprocess, max(SIZES))
+    df_features = pl.read_parquet(os.path.join(DATA_PATH, 'bronze', 'features', 'production'))
+    assert dict(df_features.select('topology', 'ami_cnt').iter_rows()) == {topology: meter_cnt for meter_cnt, topology in lake.items()}
+
+
+# conversion of one full API batch, the hours per meter shrink with the meters to stay within the batch limit
+@pytest.mark.parametrize('meter_cnt', SIZES)
+def bench_bulk_response(benchmark, meter_cnt: int):
+    response = BulkResponse.model_validate(bulk_response(meter_cnt, hours=max(1, SAMPLES_PER_BATCH_LIMIT//meter_cnt)))
+
+    df = measure(benchmark, 'pipeline', f"bulk_response[{meter_cnt}]", lambda: response.to_polars, meter_cnt)
+    assert df.n_unique('meteringPointId') == meter_cnt
@@ -0,0 +1,30 @@
+import pytest
+
+from conftest import SIZES, measure
+from synthetic import meter_ids
+
+from lib.cache import responses
+
+# routes of the web app by name, {topology} and {ami} are replaced with the synthetic topology and its first meter
+ROUTES = {'features': '/features?sort_by=ami_prod_cnt&descending=1&show_n=100&format=json',
+          'raw': '/api/raw?topology={topology}&ami={ami}',
+          'processed_rollup': '/api/processed?topology={topology}&every=1d',
+          'processed_ami': '/api/processed?topology={topology}&ami={ami}&format=arrow',
+          'duckcurve': '/api/duckcurve?topology={topology}',
+          'plot_processed': '/plot/processed?topology={topology}&every=1h'}
+
+
+@pytest.fixture(scope='module')
+def client():
+    from main import app
+    return app.test_client()
+
+
+# requests served through the test client with the rendered response cache cleared before every round
+@pytest.mark.parametrize('route', list(ROUTES))
+@pytest.mark.parametrize('meter_cnt', SIZES)
+def bench_route(benchmark, lake, client, meter_cnt: int, route: str):
+    url = ROUTES[route].format(topology=lake[meter_cnt], ami=meter_ids(meter_cnt)[0])
+
+    response = measure(benchmark, 'routes', f"{route}[{meter_cnt}]", lambda: client.get(url), meter_cnt, setup=responses.clear)
+    assert response.status_code == 200, f"{url} answered {response.status_code}"
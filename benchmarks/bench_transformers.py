@@ -0,0 +1,23 @@
+import pytest
+import os
+
+from conftest import SIZES, MEMORY_SLACK_MB, measure
+from synthetic import write_cim
+
+from lib.transformers import transformer_fields
+
+# line segments of the synthetic CIM exports per meter of the size, 400k segments (~70MB) at 1000 meters
+SEGMENTS_PER_METER = 400
+
+
+# parse of a CIM export with the transformer ahead of or behind the line segments, the memory of the streaming parse
+# stays within the slack of the benchmarks wherever the transformer is placed
+@pytest.mark.parametrize('layout', ['first', 'last'])
+@pytest.mark.parametrize('meter_cnt', SIZES)
+def bench_transformer_fields(benchmark, tmp_path, meter_cnt: int, layout: str):
+    path = os.path.join(tmp_path, 'cim.xml')
+    write_cim(path, SEGMENTS_PER_METER*meter_cnt, layout=layout)
+
+    tf = measure(benchmark, 'transformers', f"{layout}[{meter_cnt}]", lambda: transformer_fields(path), meter_cnt)
+    assert tf['mrid'] == 'tf' and tf['secondary_rated_apparent_power'] == '800'
+    assert benchmark.extra_info['peak_rss_mb'] <= MEMORY_SLACK_MB, f"parse of {os.path.getsize(path)/2**20:.0f}MB peaked at {benchmark.extra_info['peak_rss_mb']}MB"
@@ -0,0 +1,122 @@
+import threading, json, os, sys, time, tempfile, shutil, atexit
+import pytest
+
+PATH = os.path.dirname(__file__)
+ROOT_PATH = os.path.abspath(os.path.join(PATH, '..'))
+BASELINE_PATH = os.path.join(PATH, 'baselines')
+
+# rewrite the stored baselines from the current run instead of comparing against them
+UPDATE_BASELINE = os.getenv('BENCHMARK_UPDATE_BASELINE', '0') == '1'
+
+sys.path.insert(0, ROOT_PATH)
+
+# the pipeline and the web app read and write a throwaway data lake for the session, set before lib is imported
+DATA_PATH = os.environ['DATA_PATH'] = tempfile.mkdtemp(prefix='benchmark_lake_')
+atexit.register(shutil.rmtree, DATA_PATH, ignore_errors=True)
+
+
+def read_baseline(name: str) -> dict:
+    file_path = os.path.join(BASELINE_PATH, f"{name}.json")
+    if not os.path.isfile(file_path):
+        return {}
+    with open(file_path) as fp:
+        return json.load(fp)
+
+
+def write_baseline(name: str, baseline: dict):
+    os.makedirs(BASELINE_PATH, exist_ok=True)
+    with open(os.path.join(BASELINE_PATH, f"{name}.json"), 'w') as fp:
+        json.dump(baseline, fp, indent=2, sort_keys=True)
+
+
+# meters of the synthetic topologies the pipeline and the routes are benchmarked at (pytest-benchmark), a subset is
+# selected with BENCHMARK_SIZES=10,100
+SIZES = [int(size) for size in os.getenv('BENCHMARK_SIZES', '10,100,1000').split(',')]
+
+# measured rounds per size, the largest topologies are measured once
+ROUNDS = {10: 5, 100: 3}
+
+# allowed slowdown and memory growth against the baseline before a benchmark counts as regression
+TIME_TOLERANCE = 1.5
+TIME_SLACK = 0.05
+MEMORY_TOLERANCE = 1.5
+MEMORY_SLACK_MB = 64
+
+
+def rounds(meter_cnt: int) -> int:
+    return ROUNDS.get(meter_cnt, 1)
+
+
+def rss_bytes() -> int:
+    with open('/proc/self/statm') as fp:
+        return int(fp.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+
+
+# peak growth of the resident set size while the block runs, sampled from a background thread since the native
+# allocations of polars and numpy are not visible to tracemalloc
+class PeakMemory:
+
+    def __init__(self, interval: float = 0.002):
+        self.interval = interval
+        self.peak_mb = 0.0
+
+    def _sample(self):
+        while not self.done.is_set():
+            self.peak = max(self.peak, rss_bytes())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.start = self.peak = rss_bytes()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.done.set()
+        self.thread.join()
+        self.peak_mb = (max(self.peak, rss_bytes()) - self.start)/2**20
+
+
+# benchmark {function} over the rounds of the size, recording the peak memory next to the timings and comparing the
+# fastest round and the peak memory against the stored baseline {name}[{case}]
+def measure(benchmark, name: str, case: str, function, meter_cnt: int, setup=None):
+    with PeakMemory() as memory:
+        result = benchmark.pedantic(function, setup=setup, rounds=rounds(meter_cnt), iterations=1)
+    benchmark.extra_info['peak_rss_mb'] = round(memory.peak_mb, 1)
+
+    # timings are not collected with --benchmark-disable
+    if benchmark.stats is None:
+        return result
+    elapsed = benchmark.stats.stats.min
+
+    baseline = read_baseline(name)
+    if UPDATE_BASELINE:
+        write_baseline(name, {**baseline, case: {'time_s': round(elapsed, 4), 'peak_rss_mb': round(memory.peak_mb, 1)}})
+    elif case in baseline:
+        budget = baseline[case]['time_s']*TIME_TOLERANCE + TIME_SLACK
+        assert elapsed <= budget, f"{name}[{case}] took {elapsed:.3f}s, budget {budget:.3f}s (baseline {baseline[case]['time_s']:.3f}s)"
+        budget = baseline[case]['peak_rss_mb']*MEMORY_TOLERANCE + MEMORY_SLACK_MB
+        assert memory.peak_mb <= budget, f"{name}[{case}] peaked at {memory.peak_mb:.0f}MB, budget {budget:.0f}MB (baseline {baseline[case]['peak_rss_mb']:.0f}MB)"
+    return result
+
+
+# price area lookup is a web service call outside of the measured pipeline
+def stub_price_area(monkeypatch):
+    import lib.features
+    monkeypatch.setattr(lib.features, 'lat_long_to_area_api', lambda latitude, longitude: 'NO1')
+
+
+# synthetic topologies of all sizes in the session data lake by size, built once per session up to the features table
+@pytest.fixture(scope='session')
+def lake() -> dict:
+    from synthetic import write_bronze, DATE_FROM, DATE_TO, time_format
+    import lib.etl, lib.features
+
+    topologies = write_bronze(SIZES)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        stub_price_area(monkeypatch)
+        for topology in topologies.values():
+            lib.etl.etl_bronze_to_silver(topology, DATE_FROM.strftime(time_format), DATE_TO.strftime(time_format))
+        lib.features.preprocess()
+    return topologies
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+import polars as pl
+import numpy as np
+import os
+
+from lib import DATA_PATH
+from lib.index import write_measurements, write_index, BRONZE_PATH
+from lib.catalog import catalog_entries, write_catalog
+
+time_format = '%Y-%m-%dT%H:%M:%S'
+
+# six months of hourly measurements, the range the features and the web app default to
+DATE_FROM = datetime(2023, 3, 1)
+DATE_TO = datetime(2023, 9, 1)
+HOURS = int((DATE_TO - DATE_FROM)/timedelta(hours=1))
+
+# share of the meters with production (type 3) next to consumption (type 1)
+PROSUMER_SHARE = 0.3
+
+LATITUDE = 59.857865
+LONGITUDE = 10.660569
+
+
+def topology_name(meter_cnt: int) -> str:
+    return f"S_{900000 + meter_cnt}_T_{910000 + meter_cnt}"
+
+
+def meter_ids(meter_cnt: int) -> list:
+    return [f"7070575{meter_cnt:05d}{index:06d}" for index in range(meter_cnt)]
+
+
+# hourly consumption with a daily cycle and noise for every meter and hourly production with a daylight bell scaled
+# by a random PV size for the prosumers, as (meters x hours) matrices
+def load_production(meter_cnt: int, hours: int = HOURS, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    hour_of_day = (np.arange(hours) % 24)[None, :]
+
+    load = (rng.uniform(0.5, 1.5, (meter_cnt, 1))*(1 + 0.5*np.sin((hour_of_day - 6)*np.pi/12))
+            + rng.gamma(2.0, 0.1, (meter_cnt, hours)))
+    daylight = np.clip(np.sin((hour_of_day - 5)*np.pi/15), 0, None)
+    production = rng.uniform(2.0, 8.0, (meter_cnt, 1))*daylight*rng.uniform(0.2, 1.0, (meter_cnt, hours))
+    production[rng.random(meter_cnt) >= PROSUMER_SHARE] = 0
+    return load, production
+
+
+# bronze measurements of a topology with {meter_cnt} meters in the schema written by the raw to bronze ETL
+def bronze_measurements(meter_cnt: int, hours: int = HOURS, seed: int = 0) -> pl.DataFrame:
+    load, production = load_production(meter_cnt, hours=hours, seed=seed)
+    prosumers = np.flatnonzero(production.max(axis=1) > 0)
+    meters = np.array(meter_ids(meter_cnt))
+    from_time = pl.datetime_range(DATE_FROM, DATE_FROM + timedelta(hours=hours - 1), '1h', eager=True)
+
+    df = pl.concat([pl.DataFrame({'meteringPointId': np.repeat(meters[rows], hours),
+                                  'type': np.full(len(rows)*hours, type, dtype=np.int64),
+                                  'fromTime': pl.concat([from_time]*len(rows)) if len(rows) else from_time.clear(),
+                                  'value': values[rows].ravel()})
+                    for type, values, rows in [(1, load, np.arange(meter_cnt)), (3, production, prosumers)]])
+
+    return df.select('meteringPointId', 'type',
+                     pl.col('fromTime').dt.strftime(time_format),
+                     (pl.col('fromTime') + timedelta(hours=1)).dt.strftime(time_format).alias('toTime'),
+                     'value', pl.lit('kWh').alias('unit'))
+
+
+# payload of a bulk measurement response as returned by the metering API for {meter_cnt} meters over {hours}
+def bulk_response(meter_cnt: int, hours: int, seed: int = 0) -> dict:
+    df = bronze_measurements(meter_cnt, hours=hours, seed=seed)
+    return {'data': [{'meteringPointId': meter_id, 'type': type,
+                      'timeseries': [{'fromTime': from_time, 'toTime': to_time, 'value': value, 'unit': unit, 'status': True}
+                                     for from_time, to_time, value, unit in df_meter.select('fromTime', 'toTime', 'value', 'unit').iter_rows()]}
+                     for (meter_id, type), df_meter in df.group_by(['meteringPointId', 'type'], maintain_order=True)]}
+
+
+# bronze measurements, index, catalog and usage points of a topology per size in {meter_cnts} in the data lake at
+# DATA_PATH, laid out as by the raw to bronze ETL
+def write_bronze(meter_cnts: list) -> dict:
+    topologies = {meter_cnt: topology_name(meter_cnt) for meter_cnt in meter_cnts}
+    for directory in ['measurements', 'usagepoints', 'index', 'features']:
+        os.makedirs(os.path.join(DATA_PATH, 'bronze', directory), exist_ok=True)
+    os.makedirs(os.path.join(DATA_PATH, 'silver'), exist_ok=True)
+
+    df_indexes, df_catalogs = [], []
+    for meter_cnt, topology in topologies.items():
+        file_name = f"{topology}_{DATE_FROM.strftime(time_format)}_{DATE_TO.strftime(time_format)}"
+        df = bronze_measurements(meter_cnt)
+        df_index = write_measurements(df, os.path.join(BRONZE_PATH, file_name))
+        df_indexes.append(df_index.with_columns(topology=pl.lit(topology), file_name=pl.lit(file_name)))
+        df_catalogs.append(catalog_entries(topology, df))
+    write_index(pl.concat(df_indexes))
+    write_catalog(pl.concat(df_catalogs))
+
+    # usage points file read by the features preprocessing
+    pl.DataFrame({'topology': list(topologies.values()), 'longitude': [LONGITUDE]*len(topologies), 'latitude': [LATITUDE]*len(topologies),
+                  'ami_id': [meter_ids(meter_cnt) for meter_cnt in topologies]}) \
+        .write_parquet(os.path.join(DATA_PATH, 'bronze', 'usagepoints', '2023-11-22'))
+    return topologies
+
+
+CIM_HEADER = b'<?xml version="1.0" encoding="utf-8"?>\n<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" xmlns:cim="http://iec.ch/TC57/CIM100#">\n'
+CIM_FOOTER = b'</rdf:RDF>\n'
+
+CIM_TRANSFORMER = b'''<cim:PowerTransformer rdf:ID="_tf"><cim:IdentifiedObject.mRID>tf</cim:IdentifiedObject.mRID><cim:IdentifiedObject.name>T1</cim:IdentifiedObject.name><cim:PowerTransformer.operationlabel>TRAFO</cim:PowerTransformer.operationlabel></cim:PowerTransformer>
+<cim:PowerTransformerEnd rdf:ID="_tf_1"><cim:PowerTransformerEnd.endNumber>1</cim:PowerTransformerEnd.endNumber><cim:PowerTransformerEnd.ratedU>22</cim:PowerTransformerEnd.ratedU><cim:PowerTransformerEnd.ratedS>800</cim:PowerTransformerEnd.ratedS></cim:PowerTransformerEnd>
+<cim:PowerTransformerEnd rdf:ID="_tf_2"><cim:PowerTransformerEnd.endNumber>2</cim:PowerTransformerEnd.endNumber><cim:PowerTransformerEnd.ratedU>0.4</cim:PowerTransformerEnd.ratedU><cim:PowerTransformerEnd.ratedS>800</cim:PowerTransformerEnd.ratedS></cim:PowerTransformerEnd>
+'''
+
+
+# CIM export with one transformer and {segment_cnt} line segments, the transformer placed before (first) or after
+# (last) the segments
+def write_cim(path: str, segment_cnt: int, layout: str = 'last'):
+    with open(path, 'wb') as fp:
+        fp.write(CIM_HEADER)
+        if layout == 'first':
+            fp.write(CIM_TRANSFORMER)
+        for index in range(segment_cnt):
+            fp.write(f'<cim:ACLineSegment rdf:ID="_ls{index}"><cim:IdentifiedObject.name>L{index}</cim:IdentifiedObject.name>'
+                     f'<cim:Conductor.length>{index % 500}</cim:Conductor.length></cim:ACLineSegment>\n'.encode())
+        if layout == 'last':
+            fp.write(CIM_TRANSFORMER)
+        fp.write(CIM_FOOTER)
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+from lib.weather_api import WeatherStore, grid_cell
+
+DATE_FROM = datetime(2023, 6, 1)
+
+LATITUDE = 59.857865
+LONGITUDE = 10.660569
+
+
+# local stand-in for the weather service answering whole days as the service does and recording the requested windows
+class CountingFetch:
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, latitude: float, longitude: float, date_from: datetime, date_to: datetime) -> dict:
+        self.calls.append((grid_cell(latitude, longitude), date_from, date_to))
+        days = [date_from.date() + timedelta(days=day) for day in range(((date_to - timedelta(hours=1)).date() - date_from.date()).days + 1)]
+        return {'days': [{'datetime': str(day),
+                          'hours': [{'datetime': f"{hour:02d}:00:00", 'humidity': 50.0, 'cloudcover': 10.0, 'solarradiation': 100.0*hour}
+                                    for hour in range(24)]}
+                         for day in days]}
+
+
+def test_overlapping_window_fetches_missing_hours(tmp_path):
+    fetch = CountingFetch()
+    store = WeatherStore(path=str(tmp_path), fetch=fetch)
+
+    df = store.get(LATITUDE, LONGITUDE, DATE_FROM, DATE_FROM + timedelta(days=3))
+    assert df.height == 3*24
+    df = store.get(LATITUDE, LONGITUDE, DATE_FROM + timedelta(days=2), DATE_FROM + timedelta(days=5))
+    assert df.height == 3*24 and df['timestamp'].is_sorted()
+
+    assert [call[1:] for call in fetch.calls] == [(DATE_FROM, DATE_FROM + timedelta(days=3)),
+                                                  (DATE_FROM + timedelta(days=3), DATE_FROM + timedelta(days=5))]
+
+    store.get(LATITUDE, LONGITUDE, DATE_FROM + timedelta(days=1), DATE_FROM + timedelta(days=4))
+    assert len(fetch.calls) == 2
+
+
+def test_topologies_in_one_cell_share_a_fetch(tmp_path):
+    fetch = CountingFetch()
+    store = WeatherStore(path=str(tmp_path), degrees=0.1, fetch=fetch)
+
+    df = store.get(LATITUDE, LONGITUDE, DATE_FROM, DATE_FROM + timedelta(days=2))
+    df_ = store.get(LATITUDE + 0.01, LONGITUDE - 0.01, DATE_FROM, DATE_FROM + timedelta(days=2))
+    assert len(fetch.calls) == 1 and df.frame_equal(df_)
+
+    store.get(LATITUDE + 0.1, LONGITUDE, DATE_FROM, DATE_FROM + timedelta(days=2))
+    assert len(fetch.calls) == 2 and fetch.calls[0][0] != fetch.calls[1][0]
@@ -1,8 +1,42 @@
-import logging, os
+from logging.handlers import QueueHandler, QueueListener
+from datetime import datetime, timezone
+from contextlib import contextmanager
+import logging, os, sys, json, queue, atexit, threading, time, types, importlib
 
 PATH = os.path.dirname(__file__)
 LOG_PATH = PATH + '/../logs/'
 
+# root of the data lake read and written by the pipeline and the web app, DATA_PATH points them at another lake
+DATA_PATH = os.getenv('DATA_PATH', PATH + '/../data')
+
+# minimum level of records which are formatted and written, records below it return before any work is done
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+
+
+# module which is only imported on first attribute access, used for heavy optional dependencies (plotting, pandas)
+# such that entry points not using them start fast. The import of the first access is serialized, threaded workers
+# racing on it wait for the completely executed module.
+class LazyModule(types.ModuleType):
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__lock = threading.Lock()
+        self.__module = None
+
+    def __getattr__(self, attr: str):
+        if self.__module is None:
+            with self.__lock:
+                if self.__module is None:
+                    self.__module = importlib.import_module(self.__name__)
+        return getattr(self.__module, attr)
+
+
+def lazy_import(name: str):
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+
 class bcolors:
     INFO = '\033[30m'
     WARNING = '\033[93m'
@@ -10,31 +44,129 @@ class bcolors:
     ENDC = '\033[0m'
 
 
-log = lambda msg, color=bcolors.INFO: print(f"{color}{msg}{bcolors.ENDC}", logging.log(f"{color}{msg}{bcolors.ENDC}"))
+LEVEL_COLORS = {logging.DEBUG: bcolors.INFO, logging.INFO: bcolors.INFO, logging.WARNING: bcolors.WARNING, logging.ERROR: bcolors.EXCEPTION}
+COLOR_LEVELS = {bcolors.INFO: logging.INFO, bcolors.WARNING: logging.WARNING, bcolors.EXCEPTION: logging.ERROR}
+
+
+# one JSON object per line with the structured fields passed to the log call
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+                 'level': record.levelname,
+                 'logger': record.name,
+                 'process': record.process,
+                 'thread': record.threadName,
+                 'msg': record.getMessage()}
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class ConsoleFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        msg = record.getMessage() if record.exc_text is None else f"{record.getMessage()}\n{record.exc_text}"
+        return f"{LEVEL_COLORS.get(record.levelno, bcolors.INFO)}{msg}{bcolors.ENDC}"
+
+
+# renders the message and traceback in the calling thread and leaves the formatting to the background writer
+class _QueueHandler(QueueHandler):
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener = None
+_lock = threading.Lock()
+
+
+# route the 'lib' loggers through a queue to a background thread writing JSON lines to the log file and
+# colored messages to the console, such that a log call never blocks on I/O
+def _configure() -> logging.Logger:
+    global _listener
+    logger = logging.getLogger('lib')
+    with _lock:
+        if _listener is None:
+            if not os.path.exists(LOG_PATH):
+                os.makedirs(LOG_PATH, exist_ok=True)
+
+            file_handler = logging.FileHandler(LOG_PATH + 'log')
+            file_handler.setFormatter(JsonFormatter())
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setFormatter(ConsoleFormatter())
+
+            handler = _QueueHandler(queue.SimpleQueue())
+            _listener = QueueListener(handler.queue, file_handler, console_handler, respect_handler_level=True)
+            _listener.start()
+            atexit.register(lambda: _listener.stop())
+
+            # the writer thread does not survive a fork, workers forked from a preloaded app start their own
+            def restart():
+                global _listener
+                handler.queue = queue.SimpleQueue()
+                _listener = QueueListener(handler.queue, file_handler, console_handler, respect_handler_level=True)
+                _listener.start()
+            os.register_at_fork(after_in_child=restart)
+
+            logger.addHandler(handler)
+            logger.setLevel(LOG_LEVEL)
+            logger.propagate = False
+    return logger
 
 
 class Logging:
 
-    def __init__(self):
-        if not os.path.exists(LOG_PATH):
-            os.mkdir(LOG_PATH)
+    def __init__(self, name: str = None):
+        _configure()
+        name = name if name is not None else sys._getframe(1).f_globals.get('__name__', 'lib')
+        self.logger = logging.getLogger(name if name.split('.')[0] == 'lib' else f"lib.{name}")
+
+    # {stacklevel} frames up from here is the caller the record is attributed to
+    def __log(self, level: int, msg, args: tuple, fields: dict, exc_info: bool = False, stacklevel: int = 3):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, msg, *args, exc_info=exc_info, extra={'fields': fields}, stacklevel=stacklevel)
+
+    def enabled(self, level: int = logging.DEBUG) -> bool:
+        return self.logger.isEnabledFor(level)
+
+    # messages are either preformatted or formatted lazily from {args}, keyword arguments are written as fields
+    def debug(self, msg, *args, **fields):
+        self.__log(logging.DEBUG, msg, args, fields)
+
+    def info(self, msg, *args, **fields):
+        self.__log(logging.INFO, msg, args, fields)
+
+    def warning(self, msg, *args, **fields):
+        self.__log(logging.WARNING, msg, args, fields)
+
+    def error(self, msg, *args, **fields):
+        self.__log(logging.ERROR, msg, args, fields)
+
+    def exception(self, msg, *args, **fields):
+        self.__log(logging.ERROR, msg, args, fields, exc_info=sys.exc_info()[0] is not None)
 
-        logging.basicConfig(filename=LOG_PATH+'log', level=logging.INFO)
+    # log {msg} with the elapsed seconds of the block as field, also when the block raises
+    @contextmanager
+    def timed(self, msg, *args, level: int = logging.INFO, **fields):
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            # called from the exit of the context manager, one frame further from the caller
+            self.__log(level, msg, args, {**fields, 'elapsed_s': round(time.perf_counter() - t0, 6), 'ok': ok}, stacklevel=4)
 
-    def __log(self, msg:str, color: bcolors):
-        print(f"{color}{msg}{bcolors.ENDC}")
-        if color == bcolors.INFO:
-            logging.info(msg)
-        elif color == bcolors.WARNING:
-            logging.warning(msg)
-        elif color == bcolors.EXCEPTION:
-            logging.exception(msg)
 
-    def info(self, msg: str):
-        self.__log(msg, bcolors.INFO)
+def log(msg, color=bcolors.INFO):
+    _log.logger.log(COLOR_LEVELS.get(color, logging.INFO), msg)
 
-    def warning(self, msg: str):
-        self.__log(msg, bcolors.WARNING)
 
-    def exception(self, msg: str):
-        self.__log(msg, bcolors.EXCEPTION)
\ No newline at end of file
+_log = Logging('lib')
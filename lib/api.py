@@ -2,13 +2,13 @@ from requests import Request
 from pydantic import BaseModel, Field
 from datetime import datetime, timedelta
 import requests, json
-from dotenv import load_dotenv
 from typing import List
 import polars as pl
 from math import floor, ceil
 from requests.adapters import HTTPAdapter, Retry
 import os
 
+from lib.telemetry import stage
 from lib import Logging
 
 log = Logging()
@@ -100,6 +100,7 @@ def batch_iterator(query: Query):
 
 
 def fetch_bulk(query: Query) -> QueryRes:
+    from dotenv import load_dotenv
     load_dotenv()
     with requests.Session() as s:
 
@@ -123,14 +124,18 @@ def fetch_bulk(query: Query) -> QueryRes:
                 # execute query
                 req = Request('POST', url=url, data=data, headers=headers, params=params)
                 prepped = req.prepare()
-                response = s.send(prepped, timeout=1000)
+                with stage('fetch', key=batch_i.topology) as fetch:
+                    response = s.send(prepped, timeout=1000)
+                    fetch.add(bytes=len(response.content))
             except Exception as e:
                 raise Exception(f"[{datetime.utcnow()}] Failed in the API request with error code {e}. Session will be re-initiated after a 30 minute sleep.")
 
             if response.status_code == 200:
                 # parse response data as polars dataframe
                 try:
-                    df = BulkResponse(**{'data':response.json()}).to_polars
+                    with stage('parse', key=batch_i.topology) as parse:
+                        df = BulkResponse(**{'data':response.json()}).to_polars
+                        parse.add(rows=df.shape[0])
                     yield QueryRes(query=batch_i, df=df)
                 except Exception as e:
                     log.exception(f"[{datetime.utcnow()}] {batch_i.topology} abort parquet write for batch <{batch_i.name}>: {e}")
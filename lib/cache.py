@@ -0,0 +1,114 @@
+from collections import OrderedDict
+import pyarrow.parquet as pq
+import pyarrow as pa
+import polars as pl
+import os, threading
+
+
+# process-wide cache of parquet tables which is invalidated when the modification time of the file changes,
+# least recently used tables are evicted when the cache is bounded by {max_entries}
+class FileCache:
+
+    def __init__(self, reader=pl.read_parquet, max_entries: int = None):
+        self.reader = reader
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.shared = {}
+        self.lock = threading.Lock()
+
+    def get(self, path: str) -> pl.DataFrame:
+        mtime = os.stat(path).st_mtime_ns
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] == mtime:
+                self.entries.move_to_end(path)
+                return entry[1]
+
+        # zero-copy view on a table preloaded before forking, else read the file
+        shared = self.shared.get(path)
+        if shared is not None and shared[0] == mtime:
+            df = pl.from_arrow(shared[1], rechunk=False)
+        else:
+            df = self.reader(path)
+
+        with self.lock:
+            self.entries[path] = (mtime, df)
+            self.entries.move_to_end(path)
+            while self.max_entries is not None and len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return df
+
+    # read parquet tables with pyarrow into memory shared by forked workers. Polars' thread pool deadlocks in
+    # forked children when used in the parent, so the tables are only wrapped as polars frames in the workers.
+    def preload(self, paths: list):
+        for path in paths:
+            if os.path.isfile(path):
+                table = pq.read_table(path)
+                # polars uses large strings, casting upfront keeps the conversion in the workers zero-copy
+                schema = pa.schema([field.with_type(pa.large_string()) if pa.types.is_string(field.type) else field for field in table.schema])
+                self.shared[path] = (os.stat(path).st_mtime_ns, table.cast(schema))
+
+    def invalidate(self, path: str = None):
+        with self.lock:
+            if path is None:
+                self.entries.clear()
+                self.shared.clear()
+            else:
+                self.entries.pop(path, None)
+                self.shared.pop(path, None)
+
+
+# shared table cache for the web app with the tables served across topologies (features, index and loading)
+tables = FileCache()
+
+# bounded cache of the rollup and hour of day profile tables for the web app, one entry per topology and table
+ROLLUP_CACHE_ENTRIES = int(os.getenv('ROLLUP_CACHE_ENTRIES', 256))
+rollup_tables = FileCache(max_entries=ROLLUP_CACHE_ENTRIES)
+
+# bounded cache of silver topology tables for the web app
+SILVER_CACHE_ENTRIES = int(os.getenv('SILVER_CACHE_ENTRIES', 32))
+silver_tables = FileCache(max_entries=SILVER_CACHE_ENTRIES)
+
+
+# size-bounded cache of rendered responses with least recently used eviction
+class ResponseCache:
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, body: bytes, headers: dict):
+        if len(body) > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key)[0])
+            self.entries[key] = (body, headers)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                self.size -= len(self.entries.popitem(last=False)[1][0])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+# fingerprint (path, modification time, size) of the source files of a response, None when no source exists
+def fingerprint(paths: list) -> tuple:
+    stats = tuple((path, os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in paths if os.path.isfile(path))
+    return stats if len(stats) else None
+
+
+RESPONSE_CACHE_BYTES = int(os.getenv('RESPONSE_CACHE_BYTES', 256*1024*1024))
+responses = ResponseCache(max_bytes=RESPONSE_CACHE_BYTES)
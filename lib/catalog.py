@@ -0,0 +1,132 @@
+from contextlib import contextmanager
+import polars as pl
+import os, fcntl
+
+from lib.cache import FileCache
+from lib import Logging, DATA_PATH
+
+log = Logging()
+
+BRONZE_PATH = DATA_PATH + f"/bronze/measurements"
+SILVER_PATH = DATA_PATH + f"/silver/"
+CATALOG_PATH = DATA_PATH + f"/bronze/index/catalog"
+
+time_format = '%Y-%m-%dT%H:%M:%S'
+
+CATALOG_SCHEMA = {'topology': pl.Utf8, 'meteringPointId': pl.Utf8, 'types': pl.List(pl.Int64), 'first_time': pl.Datetime('us'),
+                  'last_time': pl.Datetime('us'), 'sample_cnt': pl.UInt32, 'silver': pl.Boolean}
+
+
+# catalog entries (one per meter) of the bronze measurements of a topology
+def catalog_entries(topology: str, df: pl.DataFrame) -> pl.DataFrame:
+    df_entries = (df.group_by('meteringPointId')
+                  .agg(pl.col('type').unique().sort().cast(pl.Int64).alias('types'),
+                       pl.col('fromTime').min().alias('first_time'),
+                       pl.col('fromTime').max().alias('last_time'),
+                       pl.count().cast(pl.UInt32).alias('sample_cnt')))
+
+    # bronze holds the timestamps as text, only the aggregated bounds are parsed
+    if df_entries.schema['first_time'] == pl.Utf8:
+        df_entries = df_entries.with_columns(pl.col('first_time').str.to_datetime(format=time_format),
+                                             pl.col('last_time').str.to_datetime(format=time_format))
+
+    return df_entries.with_columns(topology=pl.lit(topology), silver=pl.lit(False)).select(list(CATALOG_SCHEMA)).cast(CATALOG_SCHEMA)
+
+
+def write_catalog(df_catalog: pl.DataFrame, catalog_path: str = CATALOG_PATH):
+    os.makedirs(os.path.dirname(catalog_path), exist_ok=True)
+    df_catalog.sort(by=['topology', 'meteringPointId']).write_parquet(catalog_path + '.tmp')
+    os.replace(catalog_path + '.tmp', catalog_path)
+
+
+def read_catalog(catalog_path: str = CATALOG_PATH) -> pl.DataFrame:
+    if os.path.isfile(catalog_path):
+        return pl.read_parquet(catalog_path)
+    return pl.DataFrame(schema=CATALOG_SCHEMA)
+
+
+# serialize read-modify-write updates of the catalog between processes building silver concurrently
+@contextmanager
+def locked(catalog_path: str = CATALOG_PATH):
+    os.makedirs(os.path.dirname(catalog_path), exist_ok=True)
+    with open(catalog_path + '.lock', 'w') as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        yield
+
+
+# replace the catalog with the entries of a full bronze rebuild, keeping the silver flags of the meters still in bronze
+def replace_catalog(df_entries: pl.DataFrame, catalog_path: str = CATALOG_PATH):
+    with locked(catalog_path):
+        df_silver = read_catalog(catalog_path).filter(pl.col('silver')).select('topology', 'meteringPointId', pl.col('silver').alias('silver_'))
+        df_catalog = (df_entries.cast(CATALOG_SCHEMA)
+                      .join(df_silver, on=['topology', 'meteringPointId'], how='left')
+                      .with_columns(pl.col('silver_').fill_null(pl.col('silver')).alias('silver'))
+                      .drop('silver_'))
+        write_catalog(df_catalog, catalog_path)
+
+
+# flag the meters of a topology available in silver
+def mark_silver(topology: str, df_silver: pl.DataFrame, catalog_path: str = CATALOG_PATH):
+    meters = df_silver.select(pl.col('meteringPointId').unique())
+    with locked(catalog_path):
+        df_catalog = read_catalog(catalog_path)
+        df_catalog = df_catalog.with_columns(
+            pl.when(pl.col('topology') == topology)
+            .then(pl.col('meteringPointId').is_in(meters['meteringPointId']))
+            .otherwise(pl.col('silver')).alias('silver'))
+
+        # meters only known from silver (catalog built after bronze) are added without bronze statistics
+        df_missing = (meters.join(df_catalog.filter(pl.col('topology') == topology), on='meteringPointId', how='anti')
+                      .with_columns(topology=pl.lit(topology), types=pl.lit(None), first_time=pl.lit(None), last_time=pl.lit(None),
+                                    sample_cnt=pl.lit(None), silver=pl.lit(True))
+                      .select(list(CATALOG_SCHEMA)).cast(CATALOG_SCHEMA))
+        write_catalog(pl.concat([df_catalog, df_missing]), catalog_path)
+
+
+# in-memory lookups over the catalog table: meters of a topology and topologies of a meter
+class Catalog:
+
+    def __init__(self, df_catalog: pl.DataFrame):
+        self.df = df_catalog
+        self.meters = {topology: meters for topology, meters in
+                       df_catalog.group_by('topology', maintain_order=True).agg(pl.col('meteringPointId')).iter_rows()}
+        self.members = {topology: set(meters) for topology, meters in self.meters.items()}
+        self.topologies = {ami: topologies for ami, topologies in
+                           df_catalog.group_by('meteringPointId', maintain_order=True).agg(pl.col('topology')).iter_rows()}
+
+    def contains(self, topology: str, ami: str = None) -> bool:
+        return topology in self.members if ami is None else ami in self.members.get(topology, ())
+
+    # catalog entries of a topology, optionally narrowed to a meter
+    def entries(self, topology: str, ami: str = None) -> pl.DataFrame:
+        df = self.df.filter(pl.col('topology') == topology)
+        return df if ami is None else df.filter(pl.col('meteringPointId') == ami)
+
+
+# catalog lookups rebuilt when the catalog file changes
+catalogs = FileCache(reader=lambda path: Catalog(pl.read_parquet(path)))
+
+
+# catalog of the web app and scripts, None when no catalog was built
+def catalog(catalog_path: str = CATALOG_PATH) -> Catalog:
+    if os.path.isfile(catalog_path):
+        return catalogs.get(catalog_path)
+
+
+# rebuild the catalog from the bronze measurements and the topologies in silver
+def rebuild(bronze_path: str = BRONZE_PATH, silver_path: str = SILVER_PATH, catalog_path: str = CATALOG_PATH):
+    df_entries = []
+    for index, file_name in enumerate(os.listdir(bronze_path)):
+        topology = file_name.split(sep='_2023')[0]
+        df_entries.append(catalog_entries(topology, pl.read_parquet(os.path.join(bronze_path, file_name), columns=['meteringPointId', 'type', 'fromTime'])))
+        log.info(f"[{index}] Cataloged {df_entries[-1].shape[0]} AMI's for topology {topology}")
+    write_catalog(pl.concat(df_entries) if len(df_entries) else pl.DataFrame(schema=CATALOG_SCHEMA), catalog_path)
+
+    for topology in os.listdir(silver_path):
+        file_path = os.path.join(silver_path, topology)
+        if os.path.isfile(file_path) and topology != 'features':
+            mark_silver(topology, pl.read_parquet(file_path, columns=['meteringPointId']), catalog_path)
+
+
+if __name__ == "__main__":
+    rebuild()
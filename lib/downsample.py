@@ -0,0 +1,71 @@
+import polars as pl
+import numpy as np
+
+
+# target number of points for a trace drawn over a figure width in pixels
+def target_points(width: float, points_per_pixel: float = 1.0) -> int:
+    return max(int(width*points_per_pixel), 3)
+
+
+# positions of the x axis as float, row position for non-numeric (e.g. string timestamps) axes
+def _as_float(x: pl.Series) -> np.ndarray:
+    if x.dtype in pl.TEMPORAL_DTYPES or x.dtype in pl.NUMERIC_DTYPES:
+        return x.to_physical().to_numpy().astype(np.float64)
+    return np.arange(len(x), dtype=np.float64)
+
+
+# Largest-Triangle-Three-Buckets, returns the indices of the n_out selected points
+# https://skemman.is/bitstream/1946/15343/3/SS_MSthesis.pdf
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # n_out-2 inner buckets, first and last points are always kept
+    edges = np.linspace(1, n-1, n_out-1).astype(np.int64)
+    counts = np.diff(edges)
+
+    # average point of each bucket, the lookahead of the last bucket is the last point
+    avg_x = np.append(np.add.reduceat(x[:n-1], edges[:-1])/counts, x[-1])
+    avg_y = np.append(np.add.reduceat(y[:n-1], edges[:-1])/counts, y[-1])
+
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n-1
+
+    a = 0
+    for i in range(n_out-2):
+        lo, hi = edges[i], edges[i+1]
+        area = np.abs((x[a]-avg_x[i+1])*(y[lo:hi]-y[a]) - (x[a]-x[lo:hi])*(avg_y[i+1]-y[a]))
+        a = lo + np.argmax(area)
+        indices[i+1] = a
+    return indices
+
+
+# minimum and maximum per pixel bucket, returns the sorted indices of about n_out points
+def minmax(y: np.ndarray, n_out: int) -> np.ndarray:
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+
+    edges = np.linspace(0, n, n_out//2+1).astype(np.int64)
+    bucket = np.repeat(np.arange(len(edges)-1), np.diff(edges))
+
+    # sort on value within each bucket, the first and last entry of a bucket are its min and max
+    order = np.lexsort((y, bucket))
+    return np.unique(np.concatenate([order[edges[:-1]], order[edges[1:]-1], [0, n-1]]))
+
+
+def downsample(x: pl.Series, y: np.ndarray, n_out: int, method: str = 'lttb') -> np.ndarray:
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+    if method == 'minmax':
+        return minmax(y, n_out)
+    return lttb(_as_float(x), y, n_out)
+
+
+# downsample a frame on the union of the points selected for each of the columns
+def downsample_frame(df: pl.DataFrame, x: str, columns: list, n_out: int, method: str = 'lttb') -> pl.DataFrame:
+    if df.shape[0] <= n_out:
+        return df
+
+    indices = np.unique(np.concatenate([downsample(df[x], df[column].to_numpy(), n_out, method=method) for column in columns]))
+    return df[indices]
@@ -0,0 +1,77 @@
+from datetime import timedelta
+import polars as pl
+import os
+
+from lib.weather_api import weather, WeatherStore, WEATHER_SCHEMA
+from lib.rollups import ROLLUP_PATH, ROLLUP_INTERVALS
+from lib import Logging, DATA_PATH
+
+log = Logging()
+
+SILVER_PATH = DATA_PATH + f"/silver/"
+USAGEPOINTS_PATH = DATA_PATH + f"/bronze/usagepoints/"
+WEATHER_ENRICHED_PATH = DATA_PATH + f"/gold/weather"
+
+WEATHER_COLUMNS = [name for name in WEATHER_SCHEMA if name != 'timestamp']
+
+
+# latest parsed usagepoints with the coordinates of every topology
+def read_usagepoints(usagepoints_path: str = USAGEPOINTS_PATH) -> pl.DataFrame:
+    file_list = sorted(file_name for file_name in os.listdir(usagepoints_path) if os.path.isfile(os.path.join(usagepoints_path, file_name)))
+    return pl.read_parquet(os.path.join(usagepoints_path, file_list[-1]), columns=['topology', 'latitude', 'longitude'])
+
+
+# assign every topology to the weather grid cell of its coordinate
+def assign_cells(df_usage_points: pl.DataFrame, degrees: float) -> pl.DataFrame:
+    return df_usage_points.with_columns((pl.col('latitude') / degrees).floor().cast(pl.Int64).alias('lat_cell'),
+                                        (pl.col('longitude') / degrees).floor().cast(pl.Int64).alias('long_cell'))
+
+
+# weather averaged over the {every} interval a measurement starts in joined onto each measurement
+def join_weather(df: pl.DataFrame, df_weather: pl.DataFrame, every: str = '1h') -> pl.DataFrame:
+    df_weather = df_weather.with_columns(pl.col('timestamp').cast(df.schema['fromTime'])).sort('timestamp')
+    if every != '1h':
+        df_weather = df_weather.group_by_dynamic('timestamp', every=every).agg(pl.col(WEATHER_COLUMNS).mean())
+
+    return (df.sort('fromTime')
+            .join_asof(df_weather, left_on='fromTime', right_on='timestamp', strategy='backward', tolerance=every)
+            .drop('timestamp'))
+
+
+# silver table or neighborhood rollup {source} of a topology
+def source_path(topology: str, source: str) -> str:
+    return os.path.join(SILVER_PATH, topology) if source == 'silver' else os.path.join(ROLLUP_PATH, source, topology)
+
+
+# enrich the silver or rollup {source} of all topologies with hourly weather. Topologies are batched per weather
+# grid cell such that the weather of a cell is loaded once for all topologies mapping to it.
+def preprocess(source: str = 'silver', store: WeatherStore = weather, dst_path: str = WEATHER_ENRICHED_PATH):
+    assert source == 'silver' or source in ROLLUP_INTERVALS, f"Unknown source {source}, expected silver or one of {ROLLUP_INTERVALS}"
+
+    available = [topology for topology in os.listdir(os.path.dirname(source_path('', source))) if os.path.isfile(source_path(topology, source))]
+    df_cells = (assign_cells(read_usagepoints(), store.degrees)
+                .filter(pl.col('topology').is_in(available))
+                .group_by(['lat_cell', 'long_cell'], maintain_order=True)
+                .agg(pl.col('topology')))
+
+    dst_path = os.path.join(dst_path, source)
+    os.makedirs(dst_path, exist_ok=True)
+
+    for index, (lat_cell, long_cell, topologies) in enumerate(df_cells.rows()):
+        # time span of the cell from the parquet statistics, the topologies are then read and enriched one at a time
+        df_span = pl.concat([pl.scan_parquet(source_path(topology, source)).select(pl.col('fromTime').min().alias('date_from'),
+                                                                                  pl.col('fromTime').max().alias('date_to')).collect()
+                             for topology in topologies])
+        date_from = df_span['date_from'].min()
+        date_to = df_span['date_to'].max() + timedelta(hours=1)
+
+        df_weather = store.get_cell((lat_cell, long_cell), date_from, date_to)
+        for topology in topologies:
+            df = pl.read_parquet(source_path(topology, source))
+            join_weather(df, df_weather, every='1h' if source == 'silver' else source).write_parquet(os.path.join(dst_path, topology))
+
+        log.info(f"[{index}] Joined weather of cell {lat_cell}:{long_cell} onto {len(topologies)} topologies {topologies}")
+
+
+if __name__ == "__main__":
+    preprocess()
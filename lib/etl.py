@@ -3,10 +3,11 @@ import polars as pl
 import os, shutil, time
 
 from lib.timeseries import timeseries
-from lib.api import fetch_bulk, Query
-from lib import Logging
-
-PATH = os.path.dirname(__file__)
+from lib.index import write_measurements, write_index, find_file, INDEX_PATH
+from lib.rollups import build_rollups
+from lib.catalog import catalog_entries, replace_catalog, mark_silver
+from lib.telemetry import stage
+from lib import Logging, DATA_PATH
 
 time_format = '%Y-%m-%dT%H:%M:%S'
 
@@ -52,6 +53,8 @@ class QueryRegister:
 
 # fetch raw AMI measurement for those AMI's associated with a topology
 def etl_raw(src_path: str, dst_path: str, from_date: datetime, to_date: datetime):
+    # the measurement API client (pydantic models and dotenv) is only needed when fetching raw data
+    from lib.api import fetch_bulk, Query
 
     while True:
         try:
@@ -70,13 +73,14 @@ def etl_raw(src_path: str, dst_path: str, from_date: datetime, to_date: datetime
 
                     log.info(f"[{datetime.utcnow()}] Topology {topology_name} selected for historical measurement retrieval with {ami_id_cnt} AMI associations.")
 
-                    for query in fetch_bulk(Query(topology=topology_name, ami_id=ami_ids, from_date=from_date, to_date=to_date, resolution=1, type=1)):
-                        log.info(f"[{datetime.utcnow()}] {topology_name} successful parquet write for batch <{query.name}> with {query.sample_cnt} samples")
-                        query.df.write_parquet(os.path.join(topology_path, query.name))
-
-                    for query in fetch_bulk(Query(topology=topology_name, ami_id=ami_ids, from_date=from_date, to_date=to_date, resolution=1, type=3)):
-                        log.info(f"[{datetime.utcnow()}] {topology_name} successful parquet write for batch <{query.name}> with {query.sample_cnt} samples")
-                        query.df.write_parquet(os.path.join(topology_path, query.name))
+                    with stage('raw', key=topology_name) as raw:
+                        for measurement_type in [1, 3]:
+                            for query in fetch_bulk(Query(topology=topology_name, ami_id=ami_ids, from_date=from_date, to_date=to_date, resolution=1, type=measurement_type)):
+                                log.debug("%s successful parquet write for batch <%s> with %s samples", topology_name, query.name, query.sample_cnt, topology=topology_name, batch=query.name, samples=query.sample_cnt)
+                                with stage('write', key=topology_name) as write:
+                                    query.df.write_parquet(os.path.join(topology_path, query.name))
+                                    write.add(rows=query.sample_cnt, bytes=os.path.getsize(os.path.join(topology_path, query.name)))
+                                raw.add(rows=query.sample_cnt)
 
                     processed, _, total = registry.update(topology=topology_name, processed=True)
 
@@ -92,7 +96,7 @@ def etl_raw(src_path: str, dst_path: str, from_date: datetime, to_date: datetime
 
 
 # process the raw measurements
-def etl_raw_to_bronze(src_path: str, dst_path: str):
+def etl_raw_to_bronze(src_path: str, dst_path: str, index_path: str = INDEX_PATH):
     registry_path = os.path.join(src_path, 'registry')
 
     # clean up previous processed data
@@ -104,62 +108,76 @@ def etl_raw_to_bronze(src_path: str, dst_path: str):
         df = df.filter(pl.col('processed') == True)
         if df.shape[0]:
 
-            df_processed = pl.DataFrame()
+            df_index = []
+            df_catalog = []
             for index, row in enumerate(df.iter_rows(named=True)):
                 topology_name = row['topology']
-                file_list = os.listdir(os.path.join(src_path,topology_name))
+                with stage('bronze', key=topology_name) as bronze:
+                    file_list = os.listdir(os.path.join(src_path,topology_name))
+
+                    df_topology = pl.DataFrame()
+                    for file_name in file_list:
+                        df_pl = pl.read_parquet(os.path.join(src_path, topology_name, file_name)).drop(['status','length'])
+                        if df_pl.shape[0]:
+                            df_topology = df_pl if df_topology.is_empty() else df_topology.vstack(df_pl)
+
+                    if df_topology.shape[0]:
+                        file_name = f"{topology_name}_{df_topology.select(pl.min('fromTime')).item()}_{df_topology.select(pl.max('fromTime')).item()}"
+                        save_path = os.path.join(dst_path, file_name)
 
-                df_topology = pl.DataFrame()
-                for file_name in file_list:
-                    df_pl = pl.read_parquet(os.path.join(src_path, topology_name, file_name)).drop(['status','length'])
-                    if df_pl.shape[0]:
-                        df_topology = df_pl if df_topology.is_empty() else df_topology.vstack(df_pl)
+                        # sorted row group layout per meter with the matching index entries
+                        df_index.append(write_measurements(df_topology, save_path).with_columns(topology=pl.lit(topology_name), file_name=pl.lit(file_name)))
+                        df_catalog.append(catalog_entries(topology_name, df_topology))
+                        bronze.add(rows=df_topology.shape[0], bytes=os.path.getsize(save_path))
 
-                if df_topology.shape[0]:
-                    file_name = f"{topology_name}_{df_topology.select(pl.min('fromTime')).item()}_{df_topology.select(pl.max('fromTime')).item()}"
-                    save_path = os.path.join(dst_path, file_name)
-                    df_topology.write_parquet(save_path)
+                        log.info(f"[{index}] Processed measurements for {topology_name} with {df_topology.shape[0]} sample records taken from {df_topology.select(pl.min('fromTime')).item()} to {df_topology.select(pl.max('fromTime')).item()}")
+                    else:
+                        log.info(f"[{index}] Skipped processing measurements for {topology_name} with {df_topology.shape[0]}")
 
-                    log.info(f"[{index}] Processed measurements for {topology_name} with {df_topology.shape[0]} sample records taken from {df_topology.select(pl.min('fromTime')).item()} to {df_topology.select(pl.max('fromTime')).item()}")
-                else:
-                    log.info(f"[{index}] Skipped processing measurements for {topology_name} with {df_topology.shape[0]}")
+            if len(df_index):
+                write_index(pl.concat(df_index), index_path=index_path)
+                # bronze is rebuilt as a whole, as is the index, so entries of topologies no longer in bronze are dropped
+                replace_catalog(pl.concat(df_catalog))
 
 
 def etl_bronze_to_silver(topology: str, date_from: str, date_to: str):
 
     # source and destination for ETL
-    bronze_path = PATH + f"/../data/bronze/measurements"
-    silver_path = PATH + f"/../data/silver/"
+    bronze_path = DATA_PATH + f"/bronze/measurements"
+    silver_path = DATA_PATH + f"/silver/"
 
     if os.path.isfile(os.path.join(silver_path, topology)):
         return pl.read_parquet(os.path.join(silver_path, topology))
     else:
-        # from here onwwards we work only in datetime
-        date_from=datetime.strptime(date_from, time_format)
-        date_to=datetime.strptime(date_to, time_format)
-
-        file_list = os.listdir(bronze_path)
-        for file_name in file_list:
-            if topology == file_name.split(sep='_2023')[0]:
-                df = pl.read_parquet(os.path.join(bronze_path, file_name)).with_columns(topology=pl.lit(topology))
-                break
-
-        log.info(f"[{datetime.now().isoformat()}] ETL bronze to silver for topology path: {file_name}")
-        topology = file_name.split(sep='_2023')[0]
-        df = pl.read_parquet(os.path.join(bronze_path, file_name)).with_columns(topology=pl.lit(topology))
-
-        # convert date to datetime
-        df = (df.sort(by='fromTime')
-              .with_columns([pl.col("fromTime").str.to_datetime(format=time_format),
-                             pl.col("toTime").str.to_datetime(format=time_format)])) \
-            .filter(pl.col("fromTime").is_between(date_from, date_to)).sort(by='fromTime')
-        # make sure on unique samples
-        df = df.unique(subset=['meteringPointId','fromTime','toTime','type'], keep='first')
-
-        # batch timeseries extraction
-        df = timeseries(df_topology=df, date_from=date_from, date_to=date_to)
-        df.write_parquet(os.path.join(silver_path, topology))
-        return df
+        with stage('silver', key=topology) as silver:
+            # from here onwwards we work only in datetime
+            date_from=datetime.strptime(date_from, time_format)
+            date_to=datetime.strptime(date_to, time_format)
+
+            file_name = find_file(topology, bronze_path=bronze_path)
+
+            log.info(f"[{datetime.now().isoformat()}] ETL bronze to silver for topology path: {file_name}")
+            df = pl.read_parquet(os.path.join(bronze_path, file_name)).with_columns(topology=pl.lit(topology))
+
+            # convert date to datetime
+            df = (df.sort(by='fromTime')
+                  .with_columns([pl.col("fromTime").str.to_datetime(format=time_format),
+                                 pl.col("toTime").str.to_datetime(format=time_format)])) \
+                .filter(pl.col("fromTime").is_between(date_from, date_to)).sort(by='fromTime')
+            # make sure on unique samples
+            df = df.unique(subset=['meteringPointId','fromTime','toTime','type'], keep='first')
+
+            # batch timeseries extraction
+            df = timeseries(df_topology=df, date_from=date_from, date_to=date_to)
+            # written aside and moved in place such that readers never see a partially written silver file
+            df.write_parquet(os.path.join(silver_path, topology) + '.tmp')
+            os.replace(os.path.join(silver_path, topology) + '.tmp', os.path.join(silver_path, topology))
+            silver.add(rows=df.shape[0], bytes=os.path.getsize(os.path.join(silver_path, topology)))
+
+            # materialize neighborhood rollups alongside silver
+            build_rollups(topology, df)
+            mark_silver(topology, df)
+            return df
 
 
 
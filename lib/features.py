@@ -3,9 +3,10 @@ import polars as pl
 import os, time, requests
 
 from lib.etl import etl_bronze_to_silver
-from lib import Logging
+from lib.rollups import hourly_profile, read_profile
+from lib.telemetry import profiled
+from lib import Logging, DATA_PATH
 
-PATH = os.path.dirname(__file__)
 log = Logging()
 
 
@@ -21,15 +22,16 @@ def lat_long_to_area_api(latitude: float, longitude: float) -> dict:
         print(f"Exception raised in lat_long_to_area_api: {e}")
 
 
+@profiled('features')
 def preprocess():
 
     # config for features
     verbose = False
     date_from='2023-03-01T00:00:00'
     date_to='2023-09-01T01:00:00'
-    src_path = PATH + f"/../data/bronze/measurements"
-    dst_path = PATH + f"/../data/bronze/features"
-    usage_points_path = PATH + f"/../data/bronze/usagepoints/2023-11-22"
+    src_path = DATA_PATH + f"/bronze/measurements"
+    dst_path = DATA_PATH + f"/bronze/features"
+    usage_points_path = DATA_PATH + f"/bronze/usagepoints/2023-11-22"
 
     # read usagepoints files
     df_usage_points = pl.read_parquet(usage_points_path)
@@ -43,7 +45,6 @@ def preprocess():
         topology = file_name.split(sep='_2023')[0]
         log.info(f"[{datetime.now().isoformat()}] Compile production feature list for topology {topology} being {index} of {len(file_list)}")
 
-        t0 = time.time()
         df = etl_bronze_to_silver(topology=topology, date_from=date_from, date_to=date_to)
 
         def get_topology(df: pl.DataFrame)->pl.Utf8:
@@ -126,34 +127,24 @@ def preprocess():
 
         def get_agg_duckcurve_profiles(df:pl.DataFrame):
 
-            # group AMI's for neighborhood over {every} and solve for total of group
-            df = df.sort(by=['fromTime']).group_by_dynamic('fromTime', every='1h') \
-                .agg(pl.col('p_load_kwh').sum().alias(f"nb_load"),
-                     pl.col('p_prod_kwh').sum().alias(f"nb_prod")) \
-                .with_columns((pl.col('fromTime').map_elements(lambda datetime: datetime.hour)).alias('hour'))
-
-            # group by the 1h over entry nb and solve for average in the aggregated interval
-            df_=df.group_by(by='hour').agg(pl.col(f"nb_load").max().alias(f"nb_load_max"),
-                                           pl.col(f"nb_prod").max().alias(f"nb_prod_max")
-                                           ).sort(by='hour')
+            # hour of day profile materialized with silver, computed for topologies built before profiles existed
+            df_ = read_profile(get_topology(df))
+            df_ = hourly_profile(df) if df_ is None else df_
 
             # get the maximum load hour and also the value
-            idx = df_.select(pl.col('nb_load_max')).to_series().arg_max()
-            load_max_time =df_.select(pl.col('hour'))[idx].item()
-            load_max_val = df_.select(pl.col('nb_load_max'))[idx].item()
-            load_avg_val = df_.select(pl.col('nb_load_max')).mean().item()
+            idx = df_['nb_load_max'].arg_max()
+            load_max_time = df_['hour'][idx]
+            load_max_val = df_['nb_load_max'][idx]
+            load_avg_val = df_['nb_load_max'].mean()
 
             # get the maximum prod hour and also the value
-            try:
-                if df_.filter(pl.col('nb_prod_max')>0).shape[0]:
-                    idx = df_.select(pl.col('nb_prod_max')).to_series().arg_max()
-                    prod_max_time =df_.select(pl.col('hour'))[idx].item()
-                    prod_max_val = df_.select(pl.col('nb_prod_max'))[idx].item()
-                else:
-                    prod_max_time = 0
-                    prod_max_val = 0.0
-            except Exception as e:
-                print('exception')
+            if df_.filter(pl.col('nb_prod_max')>0).shape[0]:
+                idx = df_['nb_prod_max'].arg_max()
+                prod_max_time = df_['hour'][idx]
+                prod_max_val = df_['nb_prod_max'][idx]
+            else:
+                prod_max_time = 0
+                prod_max_val = 0.0
 
             return {'nb_aggmaxl_idx': load_max_time,
                     'nb_aggmaxl_val': load_max_val,
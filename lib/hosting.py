@@ -0,0 +1,101 @@
+import polars as pl
+import numpy as np
+import os
+
+from lib import Logging, DATA_PATH
+
+log = Logging()
+
+SILVER_PATH = DATA_PATH + f"/silver/"
+HOSTING_PATH = DATA_PATH + f"/gold/hosting_capacity"
+
+# upper bound on the (scenario, meter, hour) elements broadcast at once
+HOSTING_CHUNK_ELEMENTS = int(os.getenv('HOSTING_CHUNK_ELEMENTS', 16*1024*1024))
+
+# default grid of factors the PV production of every prosumer is scaled with
+PV_FACTORS = np.arange(1.0, 5.5, 0.5)
+
+# per house fuse limit and estimated peak transformer load (see reduction paths in the feature analysis)
+FUSE_I = 63
+FUSE_V = 230
+FUSE_KW = FUSE_I*FUSE_V*np.sqrt(3)/1000
+PEAK_LOAD_PER_HOUSE_KW = 3
+PF = 0.95
+DF = 1.4
+
+
+# estimated peak transformer capacity of a neighborhood with {ami_cnt} houses
+def estimated_capacity(ami_cnt: int) -> float:
+    return ami_cnt*PEAK_LOAD_PER_HOUSE_KW/PF/DF
+
+
+# dense (meter x hour) load and production matrices of a silver topology table
+def load_production_matrices(df: pl.DataFrame) -> tuple:
+    time_from = df.select(pl.col('fromTime').min()).item()
+    df = df.select(pl.col('meteringPointId').rank('dense').cast(pl.Int64).alias('meter') - 1,
+                   ((pl.col('fromTime') - time_from).dt.hours()).alias('hour'),
+                   pl.col('p_load_kwh').fill_null(0),
+                   pl.col('p_prod_kwh').fill_null(0))
+
+    meter, hour = df['meter'].to_numpy(), df['hour'].to_numpy()
+    shape = (meter.max()+1, hour.max()+1)
+    load, production = np.zeros(shape), np.zeros(shape)
+    np.add.at(load, (meter, hour), df['p_load_kwh'].to_numpy())
+    np.add.at(production, (meter, hour), df['p_prod_kwh'].to_numpy())
+    return load, production
+
+
+# hosting capacity of a neighborhood over the PV {factors}: per prosumer net export is broadcast over
+# (factor, meter, hour) in chunks of hours bounded by {chunk_elements}, reduced to the peak neighborhood net export,
+# the hours the neighborhood export exceeds {capacity_kw} and the meter hours exceeding the fuse limit
+def simulate(load: np.ndarray, production: np.ndarray, factors: np.ndarray, capacity_kw: float, chunk_elements: int = HOSTING_CHUNK_ELEMENTS) -> dict:
+    n_meters, n_hours = load.shape
+    factors = np.asarray(factors, dtype=np.float64)
+
+    peak_export = np.full(len(factors), -np.inf)
+    overload_hours = np.zeros(len(factors), dtype=np.int64)
+    ami_overload_hours = np.zeros(len(factors), dtype=np.int64)
+
+    chunk = max(1, chunk_elements // max(1, len(factors)*n_meters))
+    for start in range(0, n_hours, chunk):
+        net_export = factors[:, None, None]*production[None, :, start:start+chunk] - load[None, :, start:start+chunk]
+        nb_export = net_export.sum(axis=1)
+
+        peak_export = np.maximum(peak_export, nb_export.max(axis=1))
+        overload_hours += (nb_export > capacity_kw).sum(axis=1)
+        ami_overload_hours += (net_export > FUSE_KW).sum(axis=(1, 2))
+
+    return {'pv_factor': factors, 'peak_net_export_kwh': peak_export, 'overload_hours': overload_hours, 'ami_overload_hours': ami_overload_hours}
+
+
+def hosting_capacity(topology: str, df: pl.DataFrame, factors: np.ndarray = PV_FACTORS, capacity_kw: float = None) -> pl.DataFrame:
+    load, production = load_production_matrices(df)
+    ami_cnt, ami_prod_cnt = load.shape[0], int((production.max(axis=1) > 0).sum())
+    capacity_kw = estimated_capacity(ami_cnt) if capacity_kw is None else capacity_kw
+
+    return (pl.DataFrame(simulate(load, production, factors, capacity_kw))
+            .with_columns(topology=pl.lit(topology), ami_cnt=pl.lit(ami_cnt), ami_prod_cnt=pl.lit(ami_prod_cnt), capacity_kw=pl.lit(capacity_kw))
+            .with_columns((pl.col('capacity_kw') - pl.col('peak_net_export_kwh')).alias('headroom_kwh'))
+            .select('topology', 'pv_factor', 'ami_cnt', 'ami_prod_cnt', 'capacity_kw', 'peak_net_export_kwh', 'headroom_kwh', 'overload_hours', 'ami_overload_hours'))
+
+
+# simulate the hosting capacity of all topologies in silver, {capacities} (topology, capacity_kw) replaces the estimated
+# transformer capacity where available
+def preprocess(factors: np.ndarray = PV_FACTORS, capacities: pl.DataFrame = None, silver_path: str = SILVER_PATH, dst_path: str = HOSTING_PATH):
+    capacity = {} if capacities is None else dict(capacities.select('topology', 'capacity_kw').drop_nulls().iter_rows())
+
+    df_hosting = []
+    for index, topology in enumerate(os.listdir(silver_path)):
+        file_path = os.path.join(silver_path, topology)
+        if os.path.isfile(file_path) and topology != 'features':
+            df = pl.read_parquet(file_path, columns=['meteringPointId', 'fromTime', 'p_load_kwh', 'p_prod_kwh'])
+            df_hosting.append(hosting_capacity(topology, df, factors=factors, capacity_kw=capacity.get(topology)))
+            log.info(f"[{index}] Simulated hosting capacity for topology {topology} over {len(factors)} PV factors")
+
+    os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+    pl.concat(df_hosting).write_parquet(dst_path)
+    log.info(f"Saved hosting capacity of {len(df_hosting)} topologies at {dst_path}")
+
+
+if __name__ == "__main__":
+    preprocess()
@@ -0,0 +1,104 @@
+import pyarrow.parquet as pq
+import polars as pl
+import os
+
+from lib.cache import tables
+from lib import Logging, DATA_PATH
+
+log = Logging()
+
+BRONZE_PATH = DATA_PATH + f"/bronze/measurements"
+INDEX_PATH = DATA_PATH + f"/bronze/index/measurements"
+
+
+# write topology measurements sorted by meter, type and time with one row group per meter, and return the row group index.
+# Files are written next to {path} and swapped in, such that readers never see a partially written file.
+def write_measurements(df: pl.DataFrame, path: str) -> pl.DataFrame:
+    df = df.sort(by=['meteringPointId', 'type', 'fromTime'])
+
+    df_groups = (df.with_row_count('row')
+                 .group_by('meteringPointId', maintain_order=True)
+                 .agg(pl.col('row').min().alias('offset'),
+                      pl.count().alias('length'),
+                      pl.col('type').unique().alias('type'))
+                 .with_row_count('row_group'))
+
+    table = df.to_arrow()
+    with pq.ParquetWriter(path + '.tmp', table.schema) as writer:
+        for offset, length in df_groups.select('offset', 'length').iter_rows():
+            writer.write_table(table.slice(offset, length), row_group_size=length)
+    os.replace(path + '.tmp', path)
+
+    return df_groups.explode('type').select(['meteringPointId', 'type', 'row_group'])
+
+
+def write_index(df_index: pl.DataFrame, index_path: str = INDEX_PATH):
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    df_index.sort(by=['topology', 'meteringPointId', 'type']).write_parquet(index_path + '.tmp')
+    os.replace(index_path + '.tmp', index_path)
+
+
+def read_index(index_path: str = INDEX_PATH) -> pl.DataFrame:
+    if os.path.isfile(index_path):
+        return tables.get(index_path)
+
+
+# index entries for a topology, optionally narrowed to a meter and measurement type
+def lookup(topology: str, ami: str = None, type: int = None, index_path: str = INDEX_PATH) -> pl.DataFrame:
+    df_index = read_index(index_path)
+    if df_index is None:
+        return None
+
+    df_index = df_index.filter(pl.col('topology') == topology)
+    if ami is not None:
+        df_index = df_index.filter(pl.col('meteringPointId') == ami)
+    if type is not None:
+        df_index = df_index.filter(pl.col('type') == type)
+    return df_index
+
+
+# resolve the bronze file of a topology from the index, or by listing the bronze directory for unindexed data
+def find_file(topology: str, bronze_path: str = BRONZE_PATH, index_path: str = INDEX_PATH) -> str:
+    df_index = lookup(topology, index_path=index_path)
+    if df_index is not None and df_index.shape[0]:
+        return df_index.select(pl.col('file_name').first()).item()
+
+    for file_name in os.listdir(bronze_path):
+        if topology == file_name.split(sep='_2023')[0]:
+            return file_name
+
+
+# read only the row groups holding a meter (and type) for a topology, None if the topology is not indexed
+def read_measurements(topology: str, ami: str, type: int = None, bronze_path: str = BRONZE_PATH, index_path: str = INDEX_PATH) -> pl.DataFrame:
+    df_index = lookup(topology, index_path=index_path)
+    if df_index is None or df_index.is_empty():
+        return None
+
+    df_index = df_index.filter(pl.col('meteringPointId') == ami)
+    if type is not None:
+        df_index = df_index.filter(pl.col('type') == type)
+
+    file_name = lookup(topology, index_path=index_path).select(pl.col('file_name').first()).item()
+    row_groups = df_index.select(pl.col('row_group').unique().sort()).to_series().to_list()
+
+    table = pq.ParquetFile(os.path.join(bronze_path, file_name)).read_row_groups(row_groups)
+    df = pl.from_arrow(table).filter(pl.col('meteringPointId') == ami)
+    return df if type is None else df.filter(pl.col('type') == type)
+
+
+# rewrite existing bronze measurement files in the indexed layout and rebuild the index
+def reindex(bronze_path: str = BRONZE_PATH, index_path: str = INDEX_PATH):
+    df_index = []
+    for index, file_name in enumerate(os.listdir(bronze_path)):
+        topology = file_name.split(sep='_2023')[0]
+        file_path = os.path.join(bronze_path, file_name)
+        df_ = write_measurements(pl.read_parquet(file_path), file_path)
+        df_index.append(df_.with_columns(topology=pl.lit(topology), file_name=pl.lit(file_name)))
+        log.info(f"[{index}] Indexed measurements for {topology} with {df_.n_unique('meteringPointId')} AMI's")
+
+    if len(df_index):
+        write_index(pl.concat(df_index), index_path=index_path)
+
+
+if __name__ == "__main__":
+    reindex()
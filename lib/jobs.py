@@ -0,0 +1,146 @@
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+import multiprocessing
+import os, json, fcntl, threading
+
+from lib.etl import etl_bronze_to_silver
+from lib import Logging, DATA_PATH
+
+log = Logging()
+
+SILVER_PATH = DATA_PATH + f"/silver/"
+LOCK_PATH = DATA_PATH + f"/silver/.locks/"
+
+SILVER_BUILD_WORKERS = int(os.getenv('SILVER_BUILD_WORKERS', 2))
+
+# seconds finished jobs are kept by the web worker which submitted them, silver builds are answered from their shared
+# state after that
+JOB_TTL_SECONDS = int(os.getenv('JOB_TTL_SECONDS', 3600))
+
+
+# state of a silver build shared between the web workers, written next to the build lock of the topology
+def write_state(topology: str, status: str, error: str = None):
+    state_path = os.path.join(LOCK_PATH, f"{topology}.json")
+    with open(state_path + '.tmp', 'w') as fp:
+        json.dump({'id': f"silver:{topology}", 'status': status, 'error': error, 'submitted': None,
+                   'finished': None if status == 'running' else datetime.utcnow().isoformat()}, fp)
+    os.replace(state_path + '.tmp', state_path)
+
+
+def read_state(topology: str) -> dict:
+    state_path = os.path.join(LOCK_PATH, f"{topology}.json")
+    if os.path.isfile(state_path):
+        with open(state_path) as fp:
+            return json.load(fp)
+
+
+def silver_exists(topology: str) -> bool:
+    return os.path.isfile(os.path.join(SILVER_PATH, topology))
+
+
+# build silver for a topology under the build lock of the topology, a process waiting for the lock finds the silver
+# of the process holding it or builds it itself when that build failed. The lock is released when its holder dies.
+def build_silver(topology: str, date_from: str, date_to: str):
+    os.makedirs(LOCK_PATH, exist_ok=True)
+    with open(os.path.join(LOCK_PATH, topology), 'w') as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        if silver_exists(topology):
+            return
+
+        write_state(topology, 'running')
+        try:
+            etl_bronze_to_silver(topology, date_from=date_from, date_to=date_to)
+            if not silver_exists(topology):
+                raise Exception(f"no silver was written for topology {topology}")
+        except Exception as e:
+            write_state(topology, 'failed', error=str(e))
+            raise
+        write_state(topology, 'done')
+
+
+class Job:
+
+    def __init__(self, id: str, future: Future):
+        self.id = id
+        self.future = future
+        self.submitted = datetime.utcnow()
+        self.finished = None
+        future.add_done_callback(self._done)
+
+    def _done(self, future: Future):
+        self.finished = datetime.utcnow()
+        if future.exception() is not None:
+            log.exception(f"[{self.finished.isoformat()}] Job {self.id} failed: {future.exception()}")
+
+    @property
+    def status(self) -> str:
+        if self.future.done():
+            return 'failed' if self.future.exception() is not None else 'done'
+        return 'running' if self.future.running() else 'pending'
+
+    def to_dict(self) -> dict:
+        return {'id': self.id,
+                'status': self.status,
+                'error': str(self.future.exception()) if self.status == 'failed' else None,
+                'submitted': self.submitted.isoformat(),
+                'finished': None if self.finished is None else self.finished.isoformat()}
+
+
+# local background worker pool with single-flight deduplication of jobs by id
+class JobQueue:
+
+    def __init__(self, max_workers: int = SILVER_BUILD_WORKERS):
+        self.max_workers = max_workers
+        self.pool = None
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    # spawned workers, created on first use such that forked web workers do not inherit the pool
+    def _pool(self) -> ProcessPoolExecutor:
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+        return self.pool
+
+    # evict the jobs finished longer than the time to live ago, called with the lock held
+    def _prune(self):
+        expired = datetime.utcnow() - timedelta(seconds=JOB_TTL_SECONDS)
+        for id in [id for id, job in self.jobs.items() if job.finished is not None and job.finished < expired]:
+            del self.jobs[id]
+
+    def submit(self, id: str, fn, *args) -> Job:
+        with self.lock:
+            self._prune()
+            job = self.jobs.get(id)
+            if job is None or job.status in ['done', 'failed']:
+                try:
+                    future = self._pool().submit(fn, *args)
+                except BrokenProcessPool:
+                    # replace a pool with a worker that died abruptly
+                    self.pool = None
+                    future = self._pool().submit(fn, *args)
+                job = Job(id, future)
+                self.jobs[id] = job
+            return job
+
+    def get(self, id: str) -> Job:
+        return self.jobs.get(id)
+
+    # status of a job submitted by any web worker, silver builds are answered from their shared state and silver
+    def status(self, id: str) -> dict:
+        with self.lock:
+            self._prune()
+            job = self.jobs.get(id)
+        if job is not None:
+            return job.to_dict()
+        if id.startswith('silver:'):
+            topology = id.split(':', 1)[1]
+            if silver_exists(topology):
+                return {'id': id, 'status': 'done', 'error': None, 'submitted': None, 'finished': None}
+            return read_state(topology)
+
+    def submit_silver(self, topology: str, date_from: str, date_to: str) -> Job:
+        return self.submit(f"silver:{topology}", build_silver, topology, date_from, date_to)
+
+
+jobs = JobQueue()
@@ -0,0 +1,86 @@
+import polars as pl
+import os
+
+from lib.rollups import ROLLUP_PATH
+from lib import Logging, DATA_PATH
+
+log = Logging()
+
+TRANSFORMERS_PATH = DATA_PATH + f"/bronze/transformers/"
+LOADING_PATH = DATA_PATH + f"/gold/transformer_loading"
+
+# power factor converting the hourly net load in kW to apparent power in kVA
+PF = 0.95
+
+# upper bounds of the utilization histogram bins, the last bin holds all hours above the last bound
+UTILIZATION_BINS = [0.2, 0.4, 0.6, 0.8, 1.0, 1.2]
+
+TOPOLOGY_PATTERN = r'(S_\d+)_(T_\d+)'
+
+
+def utilization_bin_names() -> list:
+    bounds = [0] + [int(bound*100) for bound in UTILIZATION_BINS]
+    return [f"util_{lower}_{upper}_hours" for lower, upper in zip(bounds[:-1], bounds[1:])] + [f"util_over_{bounds[-1]}_hours"]
+
+
+# substation and transformer identifiers (S_, T_) of a topology or CIM file name
+def with_topology_keys(df: pl.DataFrame) -> pl.DataFrame:
+    return df.with_columns(pl.col('topology').str.extract(TOPOLOGY_PATTERN, 1).alias('substation_id'),
+                           pl.col('topology').str.extract(TOPOLOGY_PATTERN, 2).alias('transformer_id'))
+
+
+# latest parsed transformers with the secondary rating in kVA
+def read_transformers(transformers_path: str = TRANSFORMERS_PATH) -> pl.DataFrame:
+    file_list = sorted(file_name for file_name in os.listdir(transformers_path) if os.path.isfile(os.path.join(transformers_path, file_name)))
+    df = pl.read_parquet(os.path.join(transformers_path, file_list[-1]))
+    return (with_topology_keys(df)
+            .select('substation_id', 'transformer_id', pl.col('mrid').alias('transformer_mrid'), pl.col('name').alias('transformer_name'),
+                    pl.col('secondary_rated_apparent_power').cast(pl.Float64, strict=False).alias('rated_kva'))
+            .drop_nulls(subset=['transformer_id', 'rated_kva'])
+            .unique(subset=['substation_id', 'transformer_id'], keep='last'))
+
+
+# hourly neighborhood net load of all topologies with an hourly rollup as one long table
+def read_net_load(rollup_path: str = ROLLUP_PATH) -> pl.DataFrame:
+    hourly_path = os.path.join(rollup_path, '1h')
+    return pl.concat([pl.read_parquet(os.path.join(hourly_path, topology), columns=['fromTime', 'p_load_sum_kwh', 'p_prod_sum_kwh'])
+                      .select(pl.lit(topology).alias('topology'), 'fromTime', (pl.col('p_load_sum_kwh') - pl.col('p_prod_sum_kwh')).alias('net_load_kw'))
+                      for topology in os.listdir(hourly_path)])
+
+
+# transformer utilization of all topologies in one columnar pass: the apparent power of the hourly net load (in either
+# direction) over the rated power, summarized by a histogram of hours per utilization bin, overload hours and headroom
+def transformer_loading(df_net_load: pl.DataFrame, df_transformers: pl.DataFrame) -> pl.DataFrame:
+    df = (with_topology_keys(df_net_load)
+          .join(df_transformers, on=['substation_id', 'transformer_id'], how='inner')
+          .with_columns((pl.col('net_load_kw').abs()/PF).alias('apparent_kva'))
+          .with_columns((pl.col('apparent_kva')/pl.col('rated_kva')).alias('utilization')))
+
+    bins = [((pl.col('utilization') > lower) & (pl.col('utilization') <= upper)) if lower else (pl.col('utilization') <= upper)
+            for lower, upper in zip([0] + UTILIZATION_BINS[:-1], UTILIZATION_BINS)] + [pl.col('utilization') > UTILIZATION_BINS[-1]]
+
+    return (df.group_by('topology', maintain_order=True)
+            .agg(pl.col('transformer_mrid').first(),
+                 pl.col('transformer_name').first(),
+                 pl.col('rated_kva').first(),
+                 pl.col('apparent_kva').max().alias('peak_kva'),
+                 pl.col('utilization').max().alias('peak_utilization'),
+                 pl.col('utilization').mean().alias('avg_utilization'),
+                 (pl.col('utilization') > 1).sum().alias('overload_hours'),
+                 (pl.col('net_load_kw') < 0).sum().alias('reverse_flow_hours'),
+                 *[mask.sum().alias(name) for mask, name in zip(bins, utilization_bin_names())])
+            .with_columns((pl.col('rated_kva') - pl.col('peak_kva')).alias('headroom_kva'))
+            .sort(by='peak_utilization', descending=True))
+
+
+def preprocess(dst_path: str = LOADING_PATH):
+    df_transformers = read_transformers()
+    df_loading = transformer_loading(read_net_load(), df_transformers)
+
+    os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+    df_loading.write_parquet(dst_path)
+    log.info(f"Computed loading of {df_loading.shape[0]} transformers from {df_transformers.shape[0]} rated transformers, saved results at {dst_path}")
+
+
+if __name__ == "__main__":
+    preprocess()
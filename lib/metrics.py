@@ -0,0 +1,181 @@
+from contextlib import contextmanager
+from flask import Flask, Response, g, request, has_request_context
+import os, time, threading, json, atexit
+
+from lib import Logging
+
+log = Logging()
+
+# latency buckets in seconds of the histograms
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# requests slower than the limit in seconds are logged with their span breakdown
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', 1.0))
+
+# directory of the snapshots of the histograms of every worker of a multi-process server which /metrics merges, the
+# histograms are kept per process when it is not set
+METRICS_PATH = os.getenv('METRICS_PATH')
+
+
+# cumulative histogram in the prometheus text exposition format
+class Histogram:
+
+    def __init__(self, name: str, help: str, labels: list, buckets: tuple = BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        with self.lock:
+            counts, count, total = self.series.get(key, ((0,)*len(self.buckets), 0, 0.0))
+            counts = tuple(bucket_count+1 if value <= bound else bucket_count for bucket_count, bound in zip(counts, self.buckets))
+            self.series[key] = (counts, count+1, total+value)
+
+    def snapshot(self) -> list:
+        with self.lock:
+            return [[list(key), list(counts), count, total] for key, (counts, count, total) in self.series.items()]
+
+    # series of the snapshots of all workers summed per label values
+    @staticmethod
+    def merge(snapshots: list) -> dict:
+        series = {}
+        for snapshot in snapshots:
+            for key, counts, count, total in snapshot:
+                merged_counts, merged_count, merged_total = series.get(tuple(key), ((0,)*len(counts), 0, 0.0))
+                series[tuple(key)] = (tuple(a+b for a, b in zip(merged_counts, counts)), merged_count+count, merged_total+total)
+        return series
+
+    def expose(self, series: dict = None) -> str:
+        if series is None:
+            with self.lock:
+                series = dict(self.series)
+        series = sorted(series.items())
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, count, total) in series:
+            labels = ','.join(f'{label}="{value}"' for label, value in zip(self.labels, key))
+            for bucket_count, bound in zip(counts, self.buckets):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return '\n'.join(lines)
+
+
+# histograms of the process written to its own file under METRICS_PATH after every request and at exit. Files of
+# exited workers are kept such that the merged counts never decrease while gunicorn replaces workers.
+class Snapshots:
+
+    def __init__(self):
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def write(self):
+        if METRICS_PATH is None:
+            return
+        with self.lock:
+            # forked children inherit the exit handler of the parent, they write their own file
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.file_path = os.path.join(METRICS_PATH, f"{self.pid}_{time.time_ns()}.json")
+                atexit.register(self.write)
+            os.makedirs(METRICS_PATH, exist_ok=True)
+            with open(self.file_path + '.tmp', 'w') as fp:
+                json.dump({histogram.name: histogram.snapshot() for histogram in HISTOGRAMS}, fp)
+            os.replace(self.file_path + '.tmp', self.file_path)
+
+    def read(self) -> list:
+        self.write()
+        snapshots = []
+        for file_name in os.listdir(METRICS_PATH):
+            if file_name.endswith('.json'):
+                with open(os.path.join(METRICS_PATH, file_name)) as fp:
+                    snapshots.append(json.load(fp))
+        return snapshots
+
+
+_snapshots = Snapshots()
+
+
+# workers forked from the preloaded app start with empty histograms, the counts of the master are in its own snapshot
+def _after_fork():
+    for histogram in HISTOGRAMS:
+        histogram.series = {}
+        histogram.lock = threading.Lock()
+    _snapshots.lock = threading.Lock()
+
+
+request_seconds = Histogram('http_request_duration_seconds', 'Latency of http requests per route.', ['route', 'method', 'status'])
+span_seconds = Histogram('http_request_span_duration_seconds', 'Latency of the read, compute, convert and render phases of http requests per route.', ['route', 'span'])
+
+HISTOGRAMS = [request_seconds, span_seconds]
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _route() -> str:
+    return request.url_rule.rule if has_request_context() and request.url_rule is not None else '-'
+
+
+# time a phase of a request, the exclusive time of the span (without nested spans) is added to the request
+# breakdown and the per route span histogram
+@contextmanager
+def span(name: str):
+    stack = g.span_stack if has_request_context() and 'span_stack' in g else []
+    stack.append(0.0)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter()-t0
+        exclusive = elapsed-stack.pop()
+        if len(stack):
+            stack[-1] += elapsed
+
+        span_seconds.observe(exclusive, route=_route(), span=name)
+        if has_request_context() and 'spans' in g:
+            g.spans.append((name, exclusive))
+
+
+def _before_request():
+    g.t0 = time.perf_counter()
+    g.spans = []
+    g.span_stack = []
+
+
+def _after_request(response: Response) -> Response:
+    if 't0' not in g:
+        return response
+
+    elapsed = time.perf_counter()-g.t0
+    request_seconds.observe(elapsed, route=_route(), method=request.method, status=response.status_code)
+    _snapshots.write()
+
+    if elapsed > SLOW_REQUEST_SECONDS:
+        breakdown = {}
+        for name, seconds in g.spans:
+            breakdown[name] = breakdown.get(name, 0.0) + seconds
+        spans = ' '.join(f"{name}={seconds:.3f}s" for name, seconds in breakdown.items())
+        log.warning(f"Slow request {request.method} {request.full_path} {response.status_code} took {elapsed:.3f}s [{spans} other={elapsed-sum(breakdown.values()):.3f}s]")
+    return response
+
+
+# histograms of this process, or merged over the workers of the server when METRICS_PATH is set
+def metrics() -> Response:
+    if METRICS_PATH is None:
+        text = '\n'.join(histogram.expose() for histogram in HISTOGRAMS)
+    else:
+        snapshots = _snapshots.read()
+        text = '\n'.join(histogram.expose(Histogram.merge([snapshot.get(histogram.name, []) for snapshot in snapshots])) for histogram in HISTOGRAMS)
+    return Response(text + '\n', mimetype='text/plain; version=0.0.4')
+
+
+# request timing middleware and /metrics endpoint for the app, metrics are kept per process unless METRICS_PATH is set
+def instrument(app: Flask):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule('/metrics', 'metrics', metrics)
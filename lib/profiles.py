@@ -0,0 +1,123 @@
+import polars as pl
+import numpy as np
+import os
+
+from lib import Logging, DATA_PATH
+
+log = Logging()
+
+SILVER_PATH = DATA_PATH + f"/silver/"
+METERS_PATH = DATA_PATH + f"/gold/meters"
+CENTERS_PATH = DATA_PATH + f"/gold/meter_clusters"
+
+# number of slots of a daily (hour of day) and weekly (hour of week) profile
+PERIODS = {'day': 24, 'week': 168}
+
+# meters assigned to clusters per chunk, bounding the (meters x clusters) distance matrix
+ASSIGN_CHUNK = 65536
+
+
+def slot(period: str) -> pl.Expr:
+    if period == 'day':
+        return pl.col('fromTime').dt.hour().cast(pl.Int64)
+    return (pl.col('fromTime').dt.weekday().cast(pl.Int64) - 1)*24 + pl.col('fromTime').dt.hour().cast(pl.Int64)
+
+
+# mean {value} per meter and hour of day (or week) as a (meters x slots) matrix in one group-wise pass, rows are scaled
+# to unit maximum magnitude (normalize='max'), unit sum (normalize='sum') or left as is (normalize=None)
+def profile_matrix(df: pl.DataFrame, period: str = 'day', value: pl.Expr = pl.col('p_load_kwh'), normalize: str = 'max') -> tuple:
+    assert period in PERIODS, f"Unknown period {period}, expected one of {list(PERIODS)}"
+
+    df_profile = (df.group_by(['topology', 'meteringPointId', slot(period).alias('slot')])
+                  .agg(value.mean().alias('value'))
+                  .with_columns(pl.struct(['topology', 'meteringPointId']).rank('dense').cast(pl.Int64).alias('row') - 1))
+
+    df_meters = df_profile.select('row', 'topology', 'meteringPointId').unique(subset='row').sort('row').drop('row')
+    matrix = np.zeros((df_meters.shape[0], PERIODS[period]), dtype=np.float32)
+    matrix[df_profile['row'].to_numpy(), df_profile['slot'].to_numpy()] = df_profile['value'].fill_null(0).to_numpy()
+
+    if normalize == 'max':
+        scale = np.abs(matrix).max(axis=1, keepdims=True)
+    elif normalize == 'sum':
+        scale = matrix.sum(axis=1, keepdims=True)
+    else:
+        return df_meters, matrix
+    return df_meters, np.divide(matrix, scale, out=np.zeros_like(matrix), where=scale != 0)
+
+
+# profile matrix of the meters of all topologies in silver, read one topology at a time
+def meter_profiles(period: str = 'day', value: pl.Expr = pl.col('p_load_kwh'), normalize: str = 'max', silver_path: str = SILVER_PATH) -> tuple:
+    meters, matrices = [], []
+    for topology in os.listdir(silver_path):
+        file_path = os.path.join(silver_path, topology)
+        if os.path.isfile(file_path) and topology != 'features':
+            df_meters, matrix = profile_matrix(pl.read_parquet(file_path).with_columns(topology=pl.lit(topology)), period=period, value=value, normalize=normalize)
+            meters.append(df_meters)
+            matrices.append(matrix)
+    return pl.concat(meters), np.concatenate(matrices)
+
+
+# squared euclidean distances of the rows of {X} to the {centers}
+def _distances(X: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    return np.maximum((X**2).sum(axis=1)[:, None] - 2*X @ centers.T + (centers**2).sum(axis=1)[None, :], 0)
+
+
+# k-means++ seeding on a sample of the rows
+def _init_centers(X: np.ndarray, k: int, rng: np.random.Generator, sample_size: int) -> np.ndarray:
+    sample = X[rng.choice(len(X), size=min(len(X), sample_size), replace=False)]
+    centers = [sample[rng.integers(len(sample))]]
+    closest = _distances(sample, np.array(centers))[:, 0]
+    for _ in range(1, k):
+        p = closest/closest.sum() if closest.sum() > 0 else None
+        centers.append(sample[rng.choice(len(sample), p=p)])
+        closest = np.minimum(closest, _distances(sample, centers[-1][None, :])[:, 0])
+    return np.array(centers)
+
+
+# mini-batch k-means (Sculley, 2010): every iteration moves the centers towards a random batch of rows with a per
+# center learning rate of 1/count, memory is bounded by the batch and not by the number of rows
+def minibatch_kmeans(X: np.ndarray, k: int, batch_size: int = 1024, n_iter: int = 200, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = _init_centers(X, k, rng, sample_size=max(10*k, batch_size)).astype(np.float64)
+    counts = np.zeros(k)
+
+    for _ in range(n_iter):
+        batch = X[rng.integers(len(X), size=min(batch_size, len(X)))]
+        labels = _distances(batch, centers).argmin(axis=1)
+
+        batch_counts = np.bincount(labels, minlength=k)
+        batch_sums = np.zeros_like(centers)
+        np.add.at(batch_sums, labels, batch)
+
+        counts += batch_counts
+        updated = batch_counts > 0
+        rate = batch_counts[updated]/counts[updated]
+        centers[updated] = (1 - rate)[:, None]*centers[updated] + rate[:, None]*batch_sums[updated]/batch_counts[updated][:, None]
+    return centers
+
+
+# nearest center and its distance for every row, in chunks of rows
+def assign(X: np.ndarray, centers: np.ndarray, chunk: int = ASSIGN_CHUNK) -> tuple:
+    labels, distances = np.empty(len(X), dtype=np.int64), np.empty(len(X))
+    for start in range(0, len(X), chunk):
+        d = _distances(X[start:start+chunk], centers)
+        labels[start:start+chunk] = d.argmin(axis=1)
+        distances[start:start+chunk] = np.sqrt(d[np.arange(len(d)), labels[start:start+chunk]])
+    return labels, distances
+
+
+# cluster the daily (or weekly) load profiles of all meters and write the cluster labels to the meter table
+def preprocess(k: int = 8, period: str = 'day', meters_path: str = METERS_PATH, centers_path: str = CENTERS_PATH):
+    df_meters, matrix = meter_profiles(period=period)
+    centers = minibatch_kmeans(matrix, k=min(k, len(matrix)))
+    labels, distances = assign(matrix, centers)
+
+    os.makedirs(os.path.dirname(meters_path), exist_ok=True)
+    df_meters.with_columns(cluster=pl.Series(labels), cluster_distance=pl.Series(distances)).write_parquet(meters_path)
+    pl.DataFrame({'cluster': np.arange(len(centers)), 'center': centers.tolist(),
+                  'meter_cnt': np.bincount(labels, minlength=len(centers))}).write_parquet(centers_path)
+    log.info(f"Clustered {len(matrix)} meter {period} profiles into {len(centers)} clusters, saved results at {meters_path}")
+
+
+if __name__ == "__main__":
+    preprocess()
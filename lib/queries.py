@@ -0,0 +1,187 @@
+import polars as pl
+import os
+
+from lib.cache import tables, silver_tables, rollup_tables, SILVER_CACHE_ENTRIES, ROLLUP_CACHE_ENTRIES
+from lib.index import lookup, read_measurements, find_file, INDEX_PATH
+from lib.catalog import catalog
+from lib.loading import LOADING_PATH
+from lib.rollups import aggregate, read_rollup, hourly_profile, read_profile, ROLLUP_PATH, ROLLUP_INTERVALS, PROFILE_PATH
+from lib.metrics import span
+from lib import Logging, DATA_PATH
+
+BRONZE_PATH = DATA_PATH + f"/bronze/measurements"
+SILVER_PATH = DATA_PATH + f"/silver/"
+FEATURES_PATH = DATA_PATH + f"/bronze/features"
+
+log = Logging()
+
+date_from_default = '2023-03-01T00:00:00'
+date_to_default = '2023-09-01T00:00:00'
+
+
+def features() -> pl.DataFrame:
+    with span('read'):
+        return tables.get(os.path.join(FEATURES_PATH, 'production'))
+
+
+# feature table used for the pre-screening of neighborhoods
+def silver_features() -> pl.DataFrame:
+    with span('read'):
+        return tables.get(os.path.join(SILVER_PATH, 'features'))
+
+
+# transformer loading per topology, None before the loading table is built
+def transformer_loading() -> pl.DataFrame:
+    if not os.path.isfile(LOADING_PATH):
+        return None
+    with span('read'):
+        return tables.get(LOADING_PATH)
+
+
+# read bronze measurements of a topology, from the index for a single meter when available
+def _bronze(topology: str, ami: str = None) -> pl.DataFrame:
+    if ami is not None:
+        df = read_measurements(topology, ami, bronze_path=BRONZE_PATH)
+        if df is not None:
+            return df
+
+    for file_name in os.listdir(BRONZE_PATH):
+        if topology in file_name.split(sep='_2023')[0]:
+            df = pl.read_parquet(os.path.join(BRONZE_PATH, file_name)).with_columns(topology = pl.lit(topology))
+            return df if ami is None else df.filter(pl.col('meteringPointId') == ami)
+
+
+# meters and measurement types available for a topology in bronze
+def raw_meters(topology: str) -> pl.DataFrame:
+    with span('read'):
+        topology_catalog = catalog()
+        if topology_catalog is not None and topology_catalog.contains(topology):
+            return topology_catalog.entries(topology).explode('types').select('meteringPointId', pl.col('types').alias('type')).drop_nulls().sort(by='meteringPointId')
+
+        df_index = lookup(topology)
+        if df_index is not None and df_index.shape[0]:
+            return df_index.select('meteringPointId','type').sort(by='meteringPointId')
+        return _bronze(topology).unique(subset=['meteringPointId','type']).select('meteringPointId','type').sort(by='meteringPointId')
+
+
+# raw measurements of one meter with load (type=1) and production (type=3) series
+def raw_series(topology: str, ami: str) -> pl.DataFrame:
+    with span('read'):
+        df = _bronze(topology, ami)
+    with span('compute'):
+        return df.select(['fromTime','type','value','unit']).sort(by=['type','fromTime'])
+
+
+def silver_exists(topology: str) -> bool:
+    return os.path.isfile(os.path.join(SILVER_PATH, topology))
+
+
+# silver of a topology is missing, e.g. removed or not yet replaced by a rebuild after the route checked for it. Silver
+# is only built by the background jobs, the routes answer with the pending build.
+class SilverMissing(Exception):
+
+    def __init__(self, topology: str):
+        super().__init__(f"no silver for topology {topology}")
+        self.topology = topology
+
+
+def silver(topology: str) -> pl.DataFrame:
+    try:
+        with span('read'):
+            return silver_tables.get(os.path.join(SILVER_PATH, topology))
+    except FileNotFoundError:
+        raise SilverMissing(topology)
+
+
+def silver_meters(topology: str) -> pl.DataFrame:
+    with span('read'):
+        topology_catalog = catalog()
+        if topology_catalog is not None and silver_exists(topology):
+            df = topology_catalog.entries(topology).filter(pl.col('silver'))
+            if df.shape[0]:
+                return df.select(pl.col('meteringPointId'))
+    return silver(topology).unique(subset='meteringPointId').select(pl.col('meteringPointId'))
+
+
+# aggregated and averaged neighborhood (or single meter) profiles over {every}, None if the meter is not in the topology
+def processed_series(topology: str, every: str = '1h', ami: str = None, date_from: str = date_from_default, date_to: str = date_to_default) -> pl.DataFrame:
+
+    # serve neighborhood aggregates from the nearest materialized rollup
+    with span('read'):
+        df = read_rollup(topology, every) if ami is None else None
+
+    if df is None:
+        # initial raw read and pre-filter of measurents in appropriate range
+        df = silver(topology)
+        with span('compute'):
+            if ami is not None:
+                df = df.filter(pl.col('meteringPointId')==ami)
+                if df.is_empty():
+                    return None
+
+            # calculate aggregated and average of columns
+            df = aggregate(df, every=every)
+    return df
+
+
+# hourly aggregated neighborhood load and production profiles with the duck curve over the hour of day, served from the
+# materialized profile and computed from silver for topologies built before profiles were materialized
+def duckcurve_profile(topology: str) -> pl.DataFrame:
+    with span('read'):
+        df = read_profile(topology)
+        if df is not None:
+            return df
+    df = silver(topology)
+
+    with span('compute'):
+        return hourly_profile(df)
+
+
+# source files of the responses served for a topology, used to fingerprint rendered responses. The catalog is left out
+# since it is rewritten by the silver build of any topology, while its entries of a topology only change with the
+# bronze or silver file of the topology.
+def raw_sources(topology: str) -> list:
+    if topology in ['', None]:
+        return []
+    file_name = find_file(topology, bronze_path=BRONZE_PATH)
+    return [INDEX_PATH] + ([] if file_name is None else [os.path.join(BRONZE_PATH, file_name)])
+
+
+def silver_sources(topology: str) -> list:
+    if topology in ['', None] or not os.path.isfile(os.path.join(SILVER_PATH, topology)):
+        return []
+    return [os.path.join(SILVER_PATH, topology), os.path.join(PROFILE_PATH, topology)] + [os.path.join(ROLLUP_PATH, every, topology) for every in ROLLUP_INTERVALS]
+
+
+def features_sources() -> list:
+    return [os.path.join(FEATURES_PATH, 'production')]
+
+
+def silver_features_sources() -> list:
+    return [os.path.join(SILVER_PATH, 'features')]
+
+
+def transformer_loading_sources() -> list:
+    return [LOADING_PATH]
+
+
+# load the tables served by the web app into the process caches, called in the master of the production server
+# before forking the workers such that the workers share the preloaded tables read-only. Rollups and profiles are
+# preloaded for as many topologies as their bounded cache holds.
+def preload(silver_cnt: int = SILVER_CACHE_ENTRIES):
+    features_path = os.path.join(FEATURES_PATH, 'production')
+    tables.preload([features_path, INDEX_PATH, LOADING_PATH])
+
+    # neighborhoods with most production points first, ranked with pyarrow to keep polars unused before forking
+    topologies = []
+    if features_path in tables.shared:
+        topologies = tables.shared[features_path][1].sort_by([('ami_prod_cnt', 'descending')]).column('topology').to_pylist()
+
+    rollup_paths = [os.path.join(ROLLUP_PATH, every) for every in ROLLUP_INTERVALS] + [PROFILE_PATH]
+    rollup_tables.preload([os.path.join(rollup_path, topology) for topology in topologies[:ROLLUP_CACHE_ENTRIES//len(rollup_paths)]
+                           for rollup_path in rollup_paths])
+
+    if silver_cnt:
+        silver_tables.preload([os.path.join(SILVER_PATH, topology) for topology in topologies[:min(silver_cnt, SILVER_CACHE_ENTRIES)]])
+
+    log.info(f"Preloaded {len(tables.shared)} tables, {len(rollup_tables.shared)} rollups and {len(silver_tables.shared)} silver topologies")
@@ -0,0 +1,82 @@
+from flask import Response, request, make_response
+from datetime import datetime, timezone
+from functools import wraps
+import polars as pl
+import io, json, gzip, hashlib
+
+from lib.cache import responses, fingerprint
+from lib.metrics import span
+
+time_format = '%Y-%m-%dT%H:%M:%S'
+
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+
+# columnar json {column: [values]} with datetimes serialized in the time format used by the data lake and NaN or
+# infinite floats as null, which json has no literal for
+def to_columnar(df: pl.DataFrame) -> dict:
+    return (df.with_columns(pl.col(pl.Datetime).dt.strftime(time_format),
+                            pl.when(pl.col(pl.FLOAT_DTYPES).is_finite()).then(pl.col(pl.FLOAT_DTYPES)))
+            .to_dict(as_series=False))
+
+
+# compressed arrow ipc stream of the frame
+def to_arrow(df: pl.DataFrame, compression: str = 'zstd') -> bytes:
+    buffer = io.BytesIO()
+    df.write_ipc_stream(buffer, compression=compression)
+    return buffer.getvalue()
+
+
+# render a polars frame as html table (default), columnar json or arrow ipc
+def frame_response(df: pl.DataFrame, fmt: str = 'html'):
+    if fmt == 'json':
+        with span('convert'):
+            data = to_columnar(df)
+        with span('render'):
+            response = Response(json.dumps(data, allow_nan=False), mimetype='application/json')
+            if 'gzip' in request.headers.get('Accept-Encoding', ''):
+                response.set_data(gzip.compress(response.get_data(), compresslevel=5))
+                response.headers['Content-Encoding'] = 'gzip'
+                response.vary.add('Accept-Encoding')
+        return response
+    elif fmt == 'arrow':
+        with span('render'):
+            return Response(to_arrow(df), mimetype=ARROW_MIMETYPE)
+
+    with span('convert'):
+        df_pd = df.to_pandas()
+    with span('render'):
+        return df_pd.to_html()
+
+
+# serve a route from the rendered response cache keyed on route, query arguments and the fingerprint of the
+# source files returned by {sources}, with ETag/Last-Modified validators answering 304 on revalidation
+def cached_response(sources):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            stats = fingerprint(sources())
+            if stats is None:
+                return view(*args, **kwargs)
+
+            key = (request.path, tuple(sorted(request.args.items(multi=True))), 'gzip' in request.headers.get('Accept-Encoding', ''), stats)
+            etag = hashlib.sha1(repr(key).encode()).hexdigest()
+            last_modified = datetime.fromtimestamp(max(stat[1] for stat in stats)/1e9, tz=timezone.utc).replace(microsecond=0)
+
+            if request.if_none_match.contains(etag) or (not request.if_none_match and request.if_modified_since is not None and request.if_modified_since >= last_modified):
+                response = Response(status=304)
+            else:
+                entry = responses.get(key)
+                if entry is None:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code == 200 and not response.direct_passthrough:
+                        responses.put(key, response.get_data(), dict(response.headers))
+                else:
+                    response = Response(entry[0], headers=entry[1])
+
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,124 @@
+import polars as pl
+import os, re
+
+from lib.cache import rollup_tables
+from lib import Logging, DATA_PATH
+
+log = Logging()
+
+SILVER_PATH = DATA_PATH + f"/silver/"
+ROLLUP_PATH = DATA_PATH + f"/silver/rollups"
+
+# materialized aggregation intervals of the neighborhood rollups
+ROLLUP_INTERVALS = ['1h', '1d', '1w']
+
+# hour of day profiles of the hourly neighborhood load and production (duck curve)
+PROFILE_PATH = DATA_PATH + f"/silver/rollups/hour_of_day"
+
+
+# aggregated and averaged neighborhood load, production and export over {every}
+def aggregate(df: pl.DataFrame, every: str) -> pl.DataFrame:
+    ami_cnt = df.n_unique(subset='meteringPointId')
+
+    return df.sort(by=['fromTime']).group_by_dynamic('fromTime', every=every).agg(
+        pl.col('p_load_kwh').sum().alias('p_load_sum_kwh'),
+        (pl.col('p_load_kwh').sum()/ami_cnt).alias('p_load_avg_kwh'),
+        pl.col('p_prod_kwh').sum().alias('p_prod_sum_kwh'),
+        (pl.col('p_prod_kwh').sum()/ami_cnt).alias('p_prod_avg_kwh'),
+        (pl.col('p_prod_kwh')-pl.col('p_load_kwh')).sum().alias('p_export_sum_kwh'),
+        ((pl.col('p_prod_kwh')-pl.col('p_load_kwh')).sum()/ami_cnt).alias('p_export_avg_kwh'),
+        pl.col('meteringPointId').n_unique().alias('ami_cnt')
+    )
+
+
+# re-aggregate a finer rollup to {every}, sums add up and averages are taken over the neighborhood AMI count
+def resample(df_rollup: pl.DataFrame, every: str) -> pl.DataFrame:
+    ami_cnt = df_rollup.select(pl.col('ami_cnt').max()).item()
+
+    return df_rollup.sort(by=['fromTime']).group_by_dynamic('fromTime', every=every).agg(
+        pl.col('p_load_sum_kwh').sum(),
+        (pl.col('p_load_sum_kwh').sum()/ami_cnt).alias('p_load_avg_kwh'),
+        pl.col('p_prod_sum_kwh').sum(),
+        (pl.col('p_prod_sum_kwh').sum()/ami_cnt).alias('p_prod_avg_kwh'),
+        pl.col('p_export_sum_kwh').sum(),
+        (pl.col('p_export_sum_kwh').sum()/ami_cnt).alias('p_export_avg_kwh'),
+        pl.col('ami_cnt').max()
+    ).select(['fromTime', 'p_load_sum_kwh', 'p_load_avg_kwh', 'p_prod_sum_kwh', 'p_prod_avg_kwh', 'p_export_sum_kwh', 'p_export_avg_kwh', 'ami_cnt'])
+
+
+# materialized rollup an interval can be served from: windows in whole hours from the hourly rollup,
+# windows in whole days, weeks, months or years from the daily rollup. None for unusual intervals.
+def nearest_rollup(every: str) -> str:
+    if every in ROLLUP_INTERVALS:
+        return every
+
+    match = re.fullmatch(r'(\d+)(h|d|w|mo|q|y)', every)
+    if match is None:
+        return None
+    return '1h' if match.group(2) == 'h' else '1d'
+
+
+# max, mean and 95th percentile of the hourly neighborhood load and production per hour of day with the duck curve
+# (peak load less peak production) and the duck curve normalized by the average load
+def hourly_profile(df: pl.DataFrame) -> pl.DataFrame:
+    load_cnt = df.filter(pl.col('p_load_kwh')>0).n_unique('meteringPointId')
+    prod_cnt = df.filter(pl.col('p_prod_kwh')>0).n_unique('meteringPointId')
+
+    df_ = (df.sort(by=['fromTime']).group_by_dynamic('fromTime', every='1h')
+           .agg(pl.col('p_load_kwh').sum().alias('nb_load'),
+                pl.col('p_prod_kwh').sum().alias('nb_prod'))
+           .group_by(pl.col('fromTime').dt.hour().cast(pl.Int64).alias('hour'))
+           .agg(pl.col('nb_load').max().alias('nb_load_max'),
+                pl.col('nb_load').mean().alias('nb_load_avg'),
+                pl.col('nb_load').quantile(0.95).alias('nb_load_p95'),
+                pl.col('nb_prod').max().alias('nb_prod_max'),
+                pl.col('nb_prod').mean().alias('nb_prod_avg'),
+                pl.col('nb_prod').quantile(0.95).alias('nb_prod_p95'))
+           .sort(by='hour'))
+
+    return df_.with_columns((pl.col('nb_load_max')-pl.col('nb_prod_max')).alias('nb_duck_max'),
+                            ((pl.col('nb_load_max')-pl.col('nb_prod_max'))/pl.col('nb_load_avg')*100).alias('nb_nduck_max'),
+                            ami_load_cnt=pl.lit(load_cnt), ami_prod_cnt=pl.lit(prod_cnt))
+
+
+def build_rollups(topology: str, df: pl.DataFrame, rollup_path: str = ROLLUP_PATH, profile_path: str = PROFILE_PATH):
+    for every in ROLLUP_INTERVALS:
+        os.makedirs(os.path.join(rollup_path, every), exist_ok=True)
+        aggregate(df, every=every).write_parquet(os.path.join(rollup_path, every, topology))
+
+    os.makedirs(profile_path, exist_ok=True)
+    hourly_profile(df).write_parquet(os.path.join(profile_path, topology))
+
+
+# hour of day profile of a topology, None if not materialized
+def read_profile(topology: str, profile_path: str = PROFILE_PATH) -> pl.DataFrame:
+    file_path = os.path.join(profile_path, topology)
+    if os.path.isfile(file_path):
+        return rollup_tables.get(file_path)
+
+
+# neighborhood aggregation over {every} served from the nearest rollup, None if no rollup is available
+def read_rollup(topology: str, every: str, rollup_path: str = ROLLUP_PATH) -> pl.DataFrame:
+    source = nearest_rollup(every)
+    if source is None:
+        return None
+
+    file_path = os.path.join(rollup_path, source, topology)
+    if not os.path.isfile(file_path):
+        return None
+
+    df = rollup_tables.get(file_path)
+    return df if source == every else resample(df, every=every)
+
+
+# build rollups and hour of day profiles for all topologies in silver
+def preprocess(silver_path: str = SILVER_PATH, rollup_path: str = ROLLUP_PATH, profile_path: str = PROFILE_PATH):
+    for index, topology in enumerate(os.listdir(silver_path)):
+        file_path = os.path.join(silver_path, topology)
+        if os.path.isfile(file_path) and topology != 'features':
+            build_rollups(topology, pl.read_parquet(file_path), rollup_path=rollup_path, profile_path=profile_path)
+            log.info(f"[{index}] Built {ROLLUP_INTERVALS} rollups and hour of day profile for topology {topology}")
+
+
+if __name__ == "__main__":
+    preprocess()
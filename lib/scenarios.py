@@ -0,0 +1,70 @@
+import polars as pl
+import numpy as np
+import operator, os
+
+# upper bound on the number of threshold combinations evaluated in one pass
+SCENARIO_LIMIT = int(os.getenv('SCENARIO_LIMIT', 1_000_000))
+
+# bytes of the scenarios x neighborhoods membership matrix unpacked at once when collecting the member topologies
+UNPACK_BYTES = int(os.getenv('SCENARIO_UNPACK_BYTES', 64*1024*1024))
+
+OPERATORS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le}
+
+# number of set bits of every byte value
+POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.int64)
+
+
+# declarative reduction rule: a native polars expression per neighborhood compared with each value of a threshold range,
+# e.g. Rule('pv_penetration', pl.col('nb_prod_max')/pl.col('nb_load_max'), '>', [0.25, 0.35, 0.45])
+class Rule:
+
+    def __init__(self, name: str, expr: pl.Expr, op: str = '>', values: list = None):
+        assert op in OPERATORS, f"Unknown operator {op}, expected one of {list(OPERATORS)}"
+        self.name = name
+        self.expr = expr
+        self.op = op
+        self.values = np.atleast_1d(np.asarray(values if values is not None else [0], dtype=np.float64))
+
+    # boolean mask matrix (thresholds x neighborhoods) packed along the neighborhoods, null values never pass
+    def masks(self, values: np.ndarray) -> np.ndarray:
+        with np.errstate(invalid='ignore'):
+            mask = OPERATORS[self.op](values[None, :], self.values[:, None]) & ~np.isnan(values)[None, :]
+        return np.packbits(mask, axis=1)
+
+
+# evaluate every combination of rule thresholds over the neighborhoods in one vectorized pass. The masks of the
+# rules are combined by broadcasting, requiring all rules to pass (combine='all') or any of them (combine='any').
+# Returns one row per scenario with the threshold of each rule, the neighborhood count and the member topologies, the
+# packed masks are unpacked in chunks of scenarios such that the members of large grids are collected in bounded memory.
+def evaluate(df: pl.DataFrame, rules: list, combine: str = 'all', members: bool = True) -> pl.DataFrame:
+    assert combine in ['all', 'any'], f"Unknown combine {combine}, expected all or any"
+    n_scenarios = int(np.prod([len(rule.values) for rule in rules]))
+    assert n_scenarios <= SCENARIO_LIMIT, f"{n_scenarios} scenarios exceed the limit of {SCENARIO_LIMIT}"
+
+    df = df.unique(subset='topology', keep='first', maintain_order=True)
+    df_values = df.select([rule.expr.cast(pl.Float64).alias(rule.name) for rule in rules])
+    topologies = df['topology']
+
+    reduce = np.bitwise_and if combine == 'all' else np.bitwise_or
+    combined = None
+    for rule in rules:
+        masks = rule.masks(df_values[rule.name].to_numpy())
+        combined = masks if combined is None else reduce(combined[:, None, :], masks[None, :, :]).reshape(-1, masks.shape[1])
+
+    grid = np.meshgrid(*[rule.values for rule in rules], indexing='ij')
+    df_scenarios = pl.DataFrame({rule.name: values.ravel() for rule, values in zip(rules, grid)})
+    df_scenarios = df_scenarios.with_columns(nb_cnt=pl.Series(POPCOUNT[combined].sum(axis=1)))
+
+    if members:
+        chunk = max(1, UNPACK_BYTES//max(1, len(topologies)))
+        df_members = [pl.DataFrame(schema={'scenario': pl.Int64, 'topology': pl.List(pl.Utf8)})]
+        for start in range(0, combined.shape[0], chunk):
+            scenario, nb = np.nonzero(np.unpackbits(combined[start:start+chunk], axis=1, count=len(topologies)))
+            df_members.append(pl.DataFrame({'scenario': scenario + start, 'topology': topologies[nb]}, schema={'scenario': pl.Int64, 'topology': pl.Utf8})
+                              .group_by('scenario').agg(pl.col('topology')))
+        df_members = pl.concat(df_members)
+        df_scenarios = (df_scenarios.with_row_count('scenario').with_columns(pl.col('scenario').cast(pl.Int64))
+                        .join(df_members, on='scenario', how='left')
+                        .with_columns(pl.col('topology').fill_null(pl.lit(pl.Series([[]], dtype=pl.List(pl.Utf8)))))
+                        .drop('scenario'))
+    return df_scenarios
@@ -0,0 +1,37 @@
+import polars as pl
+import numpy as np
+
+# maximum number of thresholds along an axis before the sorted unique values are replaced by a linear grid
+GRID_SIZE_LIMIT = 200
+
+
+# thresholds for a feature column, the sorted unique values (exact surface) or a linear grid over the value range
+def thresholds(values: np.ndarray, n: int = GRID_SIZE_LIMIT) -> np.ndarray:
+    unique = np.unique(values)
+    if len(unique) <= n:
+        return unique
+    return np.linspace(unique[0], unique[-1], n)
+
+
+# number of neighborhoods with x >= x_threshold and y >= y_threshold over the grid of thresholds in one pass:
+# each neighborhood is binned on the count of thresholds it passes along both axes, and the reversed
+# cumulative sums of the 2-D histogram give the counts for every threshold pair
+def threshold_surface(df: pl.DataFrame, x: str = 'ami_prod_cnt', y: str = 'nb_aggmaxp_val', x_thresholds: np.ndarray = None, y_thresholds: np.ndarray = None) -> pl.DataFrame:
+    df = df.unique(subset='topology', keep='first', maintain_order=True).select([x, y]).drop_nulls()
+    x_values, y_values = df[x].to_numpy(), df[y].to_numpy()
+
+    x_thresholds = np.sort(thresholds(x_values) if x_thresholds is None else np.asarray(x_thresholds))
+    y_thresholds = np.sort(thresholds(y_values) if y_thresholds is None else np.asarray(y_thresholds))
+
+    # a neighborhood passes threshold i when i < number of thresholds less than or equal to its value
+    x_passed = np.searchsorted(x_thresholds, x_values, side='right')
+    y_passed = np.searchsorted(y_thresholds, y_values, side='right')
+
+    histogram = np.zeros((len(x_thresholds)+1, len(y_thresholds)+1), dtype=np.int64)
+    np.add.at(histogram, (x_passed, y_passed), 1)
+
+    counts = histogram[::-1, ::-1].cumsum(axis=0).cumsum(axis=1)[::-1, ::-1][1:, 1:]
+
+    return pl.DataFrame({f"{x}": np.repeat(x_thresholds, len(y_thresholds)),
+                         f"{y}": np.tile(y_thresholds, len(x_thresholds)),
+                         'nb_cnt': counts.ravel()})
@@ -0,0 +1,222 @@
+from contextlib import contextmanager
+from functools import wraps
+from datetime import datetime
+import polars as pl
+import os, time, threading, atexit, cProfile
+
+from lib import Logging, DATA_PATH
+
+log = Logging()
+
+TELEMETRY_PATH = DATA_PATH + f"/telemetry/runs"
+PROFILE_PATH = DATA_PATH + f"/telemetry/profiles"
+
+# stage telemetry is recorded unless disabled with TELEMETRY=0, TELEMETRY_PROFILE=1 adds a cProfile dump per stage
+TELEMETRY = os.getenv('TELEMETRY', '1') == '1'
+TELEMETRY_PROFILE = os.getenv('TELEMETRY_PROFILE', '0') == '1'
+
+# records buffered by a run before they are written ahead of the exit of the process
+FLUSH_RECORDS = int(os.getenv('TELEMETRY_FLUSH_RECORDS', 100000))
+
+# seconds between the samples of the resident set size of the running stages
+SAMPLE_INTERVAL = float(os.getenv('TELEMETRY_SAMPLE_INTERVAL', 0.01))
+
+TELEMETRY_SCHEMA = {'run_id': pl.Utf8, 'pid': pl.Int64, 'seq': pl.Int64, 'stage': pl.Utf8, 'parent': pl.Utf8, 'depth': pl.Int64,
+                    'key': pl.Utf8, 'started_at': pl.Datetime('us'), 'wall_s': pl.Float64, 'cpu_s': pl.Float64, 'rows': pl.Int64,
+                    'bytes': pl.Int64, 'peak_rss_mb': pl.Float64, 'rss_delta_mb': pl.Float64, 'ok': pl.Boolean, 'profile': pl.Utf8}
+
+
+# counters of a running stage, set by the instrumented code
+class Stage:
+
+    def __init__(self, name: str, key: str = None):
+        self.name = name
+        self.key = key
+        self.rows = None
+        self.bytes = None
+
+    def add(self, rows: int = None, bytes: int = None):
+        if rows is not None:
+            self.rows = (self.rows or 0) + rows
+        if bytes is not None:
+            self.bytes = (self.bytes or 0) + bytes
+
+
+# stage records of the run of this process, written as one part file at exit (or per FLUSH_RECORDS records)
+class Run:
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.run_id = f"{datetime.now().strftime('%Y%m%dT%H%M%S')}_{self.pid}"
+        self.seq = 0
+        self.part = 0
+        self.records = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.peaks = {}
+        atexit.register(self.flush)
+        threading.Thread(target=self._sample, daemon=True).start()
+
+    # peak resident set size of the running stages by seq, sampled from a background thread since the transient
+    # allocations of polars within a stage are freed before it exits
+    def _sample(self):
+        while True:
+            time.sleep(SAMPLE_INTERVAL)
+            if len(self.peaks):
+                self.sample()
+
+    def sample(self):
+        rss = rss_mb()
+        with self.lock:
+            for seq, peak in self.peaks.items():
+                self.peaks[seq] = max(peak, rss)
+        return rss
+
+    def start_peak(self, seq: int) -> float:
+        rss = rss_mb()
+        with self.lock:
+            self.peaks[seq] = rss
+        return rss
+
+    def stop_peak(self, seq: int) -> tuple:
+        rss = self.sample()
+        with self.lock:
+            return self.peaks.pop(seq), rss
+
+    def stack(self) -> list:
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def next_seq(self) -> int:
+        with self.lock:
+            self.seq += 1
+            return self.seq
+
+    def append(self, record: dict):
+        with self.lock:
+            self.records.append(record)
+            full = len(self.records) >= FLUSH_RECORDS
+        if full:
+            self.flush()
+
+    def flush(self):
+        # forked children inherit the exit handler and the records of the parent run
+        if os.getpid() != self.pid:
+            return
+        with self.lock:
+            records, self.records = self.records, []
+            self.part += 1
+            part = self.part
+        if len(records):
+            os.makedirs(TELEMETRY_PATH, exist_ok=True)
+            file_path = os.path.join(TELEMETRY_PATH, f"{self.run_id}_{part:05d}.parquet")
+            pl.DataFrame(records, schema=TELEMETRY_SCHEMA).write_parquet(file_path + '.tmp')
+            os.replace(file_path + '.tmp', file_path)
+
+
+_run = None
+
+
+# run of the current process, forked and spawned workers record their own run
+def run() -> Run:
+    global _run
+    if _run is None or _run.pid != os.getpid():
+        _run = Run()
+    return _run
+
+
+def rss_mb() -> float:
+    with open('/proc/self/statm') as fp:
+        return int(fp.read().split()[1])*os.sysconf('SC_PAGE_SIZE')/2**20
+
+
+# record wall and cpu time, rows, bytes, the peak resident set size while a pipeline stage runs and its growth over
+# the stage (RSS at exit minus at entry, negative when the stage frees more than it keeps), nested stages keep their
+# parent. A profile of the stage is dumped in pstats format when profiling is enabled and no enclosing stage profiles.
+@contextmanager
+def stage(name: str, key: str = None, profile: bool = None):
+    if not TELEMETRY:
+        yield Stage(name, key)
+        return
+
+    current = run()
+    stack = current.stack()
+    parent = stack[-1] if len(stack) else None
+    seq = current.next_seq()
+
+    profiler = None
+    if (TELEMETRY_PROFILE if profile is None else profile) and not any(entry[1] for entry in stack):
+        profiler = cProfile.Profile()
+
+    counters = Stage(name, key)
+    stack.append((name, profiler is not None))
+    started_at, t0, c0, rss0 = datetime.now(), time.perf_counter(), time.process_time(), current.start_peak(seq)
+    ok = False
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield counters
+        ok = True
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        wall_s, cpu_s = time.perf_counter() - t0, time.process_time() - c0
+        peak_rss, rss = current.stop_peak(seq)
+        stack.pop()
+
+        profile_file = None
+        if profiler is not None:
+            os.makedirs(os.path.join(PROFILE_PATH, current.run_id), exist_ok=True)
+            profile_file = os.path.join(PROFILE_PATH, current.run_id, f"{seq:05d}_{name}.prof")
+            profiler.dump_stats(profile_file)
+
+        current.append({'run_id': current.run_id, 'pid': current.pid, 'seq': seq, 'stage': name, 'parent': parent[0] if parent else None,
+                        'depth': len(stack), 'key': key, 'started_at': started_at, 'wall_s': wall_s, 'cpu_s': cpu_s,
+                        'rows': counters.rows, 'bytes': counters.bytes, 'peak_rss_mb': peak_rss, 'rss_delta_mb': rss - rss0, 'ok': ok, 'profile': profile_file})
+        log.debug("Stage %s completed in %.3fs", name, wall_s, stage=name, key=key, wall_s=round(wall_s, 6), cpu_s=round(cpu_s, 6),
+                  rows=counters.rows, bytes=counters.bytes)
+
+
+# record every call of the decorated function as stage {name}
+def profiled(name: str = None):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name or function.__name__):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# stage records of all runs, optionally of the runs started from {since}
+def read_telemetry(since: datetime = None, telemetry_path: str = None) -> pl.DataFrame:
+    telemetry_path = TELEMETRY_PATH if telemetry_path is None else telemetry_path
+    if not os.path.isdir(telemetry_path) or not any(file_name.endswith('.parquet') for file_name in os.listdir(telemetry_path)):
+        return pl.DataFrame(schema=TELEMETRY_SCHEMA)
+    lf = pl.scan_parquet(os.path.join(telemetry_path, '*.parquet'))
+    return (lf if since is None else lf.filter(pl.col('started_at') >= since)).collect()
+
+
+# wall time, cpu time, throughput, peak memory and largest memory growth per run and stage, the trend of the pipeline performance over runs
+def summary(df_telemetry: pl.DataFrame) -> pl.DataFrame:
+    return (df_telemetry.group_by(['run_id', 'stage'], maintain_order=True)
+            .agg(pl.col('started_at').min(),
+                 pl.count().alias('calls'),
+                 pl.col('wall_s').sum(),
+                 pl.col('cpu_s').sum(),
+                 pl.col('rows').sum(),
+                 pl.col('bytes').sum(),
+                 pl.col('peak_rss_mb').max(),
+                 pl.col('rss_delta_mb').max(),
+                 (~pl.col('ok')).sum().alias('failed'))
+            .with_columns((pl.col('rows')/pl.col('wall_s')).alias('rows_per_s'),
+                          (pl.col('bytes')/pl.col('wall_s')/2**20).alias('mb_per_s'))
+            .sort(by=['started_at', 'stage']))
+
+
+if __name__ == "__main__":
+    with pl.Config() as cfg:
+        cfg.set_tbl_cols(-1)
+        cfg.set_tbl_rows(100)
+        print(summary(read_telemetry()))
@@ -1,13 +1,16 @@
-import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
-import pandas as pd
 import polars as pl
 import numpy as np
 
+from lib import lazy_import
+
+pd = lazy_import('pandas')
+
 time_format = '%Y-%m-%dT%H:%M:%S'
 
 
 def _plot(df_orig: pl.DataFrame, df_interp: pl.DataFrame):
+    import matplotlib.pyplot as plt
 
     fig, ax = plt.subplots()
     plt.plot(df_orig.select(pl.col('fromTime')), df_orig.select(pl.col('value')), 'b-', label='Original')
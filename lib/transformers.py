@@ -1,65 +1,124 @@
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from lxml import etree
+from itertools import chain
 import polars as pl
 import os
 
-from lib import Logging
+from lib import Logging, lazy_import, DATA_PATH
 
 log = Logging()
 
-PATH = os.path.dirname(__file__)
+etree = lazy_import('lxml.etree')
 
 
-def parse_tag(root, tag:str)->dict:
-    results = []
-    for index, element in enumerate(root.findall(tag, root.nsmap)):
-        content = {}
-        for child in element.iterchildren():
-            if child.text is not  None:
-                content[child.tag.split('.')[-1]] = child.text
-        results.append(content)
-    return results
+TRANSFORMER_TAGS = ['PowerTransformer', 'PowerTransformerEnd']
 
+# bytes read from a CIM file per parser feed
+CHUNK_SIZE = 1024*1024
 
-def parse_transformer(path: str) -> pl.DataFrame:
 
-    tree = etree.parse(path)
-    root = tree.getroot()
+def parse_element(element) -> dict:
+    content = {}
+    for child in element.iterchildren():
+        if child.text is not None:
+            content[child.tag.split('.')[-1]] = child.text
+    return content
+
+
+# qualified tag of the document root (rdf:RDF in CIM exports, any element otherwise) from an unfiltered parse of the
+# head of the file, returned with the bytes read to find it
+def root_tag(fp, chunk_size: int = CHUNK_SIZE) -> tuple:
+    parser = etree.XMLPullParser(events=('start',), huge_tree=True)
+    head = b''
+    for chunk in iter(lambda: fp.read(chunk_size), b''):
+        head += chunk
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            return element.tag, head
+    return None, head
+
+
+# stream the CIM file in chunks through an incremental (iterparse style) pull parser which only reports the document
+# root and the PowerTransformer/PowerTransformerEnd elements. The parser still builds the tree of every element, the
+# completed top level elements are cleared after every chunk such that memory stays flat for large CIM exports
+# wherever the transformers are placed in the file
+def iter_transformer_elements(path: str, chunk_size: int = CHUNK_SIZE):
+    with open(path, 'rb') as fp:
+        document_tag, head = root_tag(fp, chunk_size)
+        if document_tag is None:
+            return
+        tags = [document_tag] + [f"{{*}}{tag}" for tag in TRANSFORMER_TAGS]
+        parser = etree.XMLPullParser(events=('start', 'end'), tag=tags, huge_tree=True)
+
+        root = None
+        for chunk in chain([head], iter(lambda: fp.read(chunk_size), b'')):
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                if event == 'start':
+                    root = element if root is None else root
+                elif element is not root:
+                    yield etree.QName(element).localname, parse_element(element)
+
+            # release all parsed top level elements except the last one which may still be incomplete
+            if root is not None and len(root) > 1:
+                del root[:-1]
+
+    for event, element in parser.read_events():
+        if event == 'end' and element is not root:
+            yield etree.QName(element).localname, parse_element(element)
+    parser.close()
 
+
+def transformer_fields(path: str) -> dict:
     tf = {}
-    for element in parse_tag(root, 'cim:PowerTransformer'):
-        tf['mrid'] = element['mRID']
-        tf['name'] = element['name']
-        tf['faceplate'] = element['operationlabel']
-    for element in parse_tag(root, 'cim:PowerTransformerEnd'):
-        winding  = 'primary' if (element['endNumber'] == '1') else 'secondary'
-        tf[f'{winding}_rated_voltage'] = element['ratedU']
-        tf[f'{winding}_rated_apparent_power'] = element['ratedS']
-    return pl.DataFrame(tf)
+    for tag, element in iter_transformer_elements(path):
+        if tag == 'PowerTransformer':
+            tf['mrid'] = element['mRID']
+            tf['name'] = element['name']
+            tf['faceplate'] = element['operationlabel']
+        else:
+            winding  = 'primary' if (element['endNumber'] == '1') else 'secondary'
+            tf[f'{winding}_rated_voltage'] = element['ratedU']
+            tf[f'{winding}_rated_apparent_power'] = element['ratedS']
+    return tf
+
+
+def parse_transformer(path: str) -> pl.DataFrame:
+    return pl.DataFrame(transformer_fields(path))
 
 
-def preprocess():
-    src_path = PATH + f"/../data/raw/cim/"
-    dst_path = PATH + f"/../data/bronze/transformers/"
+# worker entry returning the parsed transformer, tagged with the topology named by the CIM file, or the error for a CIM file
+def _parse_file(path: str) -> tuple:
+    try:
+        return {'topology': os.path.basename(path).split('.xml')[0], **transformer_fields(path)}, None
+    except Exception as e:
+        return None, e
+
+
+def preprocess(max_workers: int = None):
+    src_path = DATA_PATH + f"/raw/cim/"
+    dst_path = DATA_PATH + f"/bronze/transformers/"
 
     file_list = os.listdir(src_path)
-    df_tf = pl.DataFrame()
+    transformers = []
     unparsed_tf = []
-    for index, file_name in enumerate(file_list):
-        print(f'[{index}] Parse {file_name} CIM file')
-        try:
-            df_pl = parse_transformer(path=os.path.join(src_path, file_name))
-            df_tf = df_pl if df_tf.is_empty() else df_tf.vstack(df_pl)
-        except Exception as e:
-            unparsed_tf.append(file_name.split('.xml')[0])
-            log.exception(msg=f'[{index}] Cannot parse {file_name} CIM file')
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        for index, (file_name, (tf, e)) in enumerate(zip(file_list, pool.map(_parse_file, [os.path.join(src_path, file_name) for file_name in file_list], chunksize=8))):
+            if e is None:
+                transformers.append(tf)
+            else:
+                unparsed_tf.append(file_name.split('.xml')[0])
+                log.error(f'[{index}] Cannot parse {file_name} CIM file: {e}')
+
+    # concatenate all parsed transformers once
+    df_tf = pl.from_dicts(transformers, infer_schema_length=None)
 
     dst_file_path = os.path.join(dst_path, f"{datetime.now().date()}")
     df_tf.write_parquet(dst_file_path)
 
     if len(unparsed_tf):
         log.warning(f"Unparsed {len(unparsed_tf)} transformers for the following topologies: {unparsed_tf}")
-    log.info(f"Parsed {index} topologies and saved results at {dst_file_path}")
+    log.info(f"Parsed {len(transformers)} topologies and saved results at {dst_file_path}")
 
 
 if __name__ == "__main__":
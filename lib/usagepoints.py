@@ -1,83 +1,95 @@
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import polars as pl
-import pandas as pd
-import os, json, requests
+import os
 
-from lib import Logging
+try:
+    import orjson as json
+except ImportError:
+    import json
+
+from lib import Logging, DATA_PATH
 
-PATH = os.path.dirname(__file__)
 log = Logging()
 
+# Holtermanns v. 7, 7030 Trondheim
+DEFAULT_LATITUDE = 59.857865
+DEFAULT_LONGITUDE = 10.660569
+
+
+# extract the AMI ID's of a topology usagepoints file, given either as list of records or as columns
+def parse_usagepoints(path: str) -> tuple:
+    with open(path, 'rb') as fp:
+        data = json.loads(fp.read())
+
+    if isinstance(data, dict):
+        ami_id = data['IdentifiedObject.name']
+        ami_id = list(ami_id.values()) if isinstance(ami_id, dict) else ami_id
+    else:
+        ami_id = [record.get('IdentifiedObject.name') for record in data]
+
+    topology = os.path.basename(path).split('.json')[0]
+    return topology, ami_id
+
+
+def read_coordinates(path: str) -> pl.DataFrame:
+    schema = {'topology': pl.Utf8, 'longitude': pl.Float64, 'latitude': pl.Float64}
+    if not os.path.isfile(path):
+        return pl.DataFrame(schema=schema)
+
+    return (pl.read_csv(path, separator=',')
+            .rename({'filename': 'topology'})
+            .select([pl.col(name).cast(dtype) for name, dtype in schema.items()])
+            .unique(subset='topology', keep='first', maintain_order=True))
 
-def preprocess():
+
+# join coordinates onto the topologies in one pass, topologies without coordinates get the default location
+def join_coordinates(df: pl.DataFrame, df_coord: pl.DataFrame) -> pl.DataFrame:
+    df = (df.join(df_coord, on='topology', how='left')
+          .with_columns(pl.col('latitude').fill_null(DEFAULT_LATITUDE),
+                        pl.col('longitude').fill_null(DEFAULT_LONGITUDE)))
+
+    # TODO hack to solve data quality issue from Norgesnett, latitude and longitude are swapped for some topologies
+    swapped = pl.col('latitude') < pl.col('longitude')
+    return df.with_columns(pl.when(swapped).then(pl.col('longitude')).otherwise(pl.col('latitude')).alias('latitude'),
+                           pl.when(swapped).then(pl.col('latitude')).otherwise(pl.col('longitude')).alias('longitude'))
+
+
+def preprocess(max_workers: int = None):
 
     # source and destination for ETL
-    coordinates_path = PATH + f"/../data/raw/coordinates/usagepoints.csv"
-    src_path = PATH + f"/../data/raw/usagepoints/"
-    dst_path = PATH + f"/../data/bronze/usagepoints/"
+    coordinates_path = DATA_PATH + f"/raw/coordinates/usagepoints.csv"
+    src_path = DATA_PATH + f"/raw/usagepoints/"
+    dst_path = DATA_PATH + f"/bronze/usagepoints/"
 
     # build file list of topologies containing usagepoints
-    files = []
-    for file_path in os.listdir(src_path):
-        if os.path.isfile(os.path.join(src_path, file_path)):
-            files.append(file_path)
-
-    # build usagepoints coordinate map
-    if os.path.isfile(coordinates_path):
-        with open(coordinates_path,'r') as fp:
-            df_coord = pd.read_csv(fp, sep=',').rename(columns={'filename': 'topology'})
-
-    # parse constructed file list of usagepoints
-    df=None
-    missing_coordinates = []
-    for index, file_path in enumerate(files):
-        with open(os.path.join(src_path, file_path)) as fp:
-            data = fp.read()
-            topology = file_path.split('.json')[0]
-            ami_id = pl.DataFrame(json.loads(data)).select('IdentifiedObject.name').rename({'IdentifiedObject.name': 'ami_id'}).to_numpy().flatten().tolist()
-
-            coord = df_coord.loc[df_coord['topology']==topology]
-            # Holtermanns v. 7, 7030 Trondheim
-            longitude = 59.857865
-            latitude = 10.660569
-
-            try:
-                longitude = coord.iloc[0]['longitude']
-                latitude = coord.iloc[0]['latitude']
-            except Exception as e:
-                missing_coordinates.append(topology)
-
-            # TODO hack to solve data quality issue from Norgesnett
-            if latitude < longitude:
-                latitude_ = latitude
-                latitude = longitude
-                longitude = latitude_
-
-            data = {'topology': topology,
-                    'longitude':longitude,
-                    'latitude':latitude,
-                    'ami_id':ami_id}
-            df_ = pl.DataFrame(data, schema={'topology': pl.Utf8,
-                                             'longitude':pl.Float64,
-                                             'latitude':pl.Float64,
-                                             'ami_id': pl.List(pl.Utf8)})
-            df = df_ if df is None else df.vstack(df_)
-            print(f"[{index}] Parsed {df_.shape[0]} unique AMI ID's for topology {topology} at longitude:latitude {longitude}:{latitude}")
+    files = [os.path.join(src_path, file_path) for file_path in os.listdir(src_path) if os.path.isfile(os.path.join(src_path, file_path))]
+
+    # parse usagepoints files in parallel
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        parsed = list(pool.map(parse_usagepoints, files, chunksize=16))
+
+    df = pl.DataFrame({'topology': [topology for topology, _ in parsed],
+                       'ami_id': [ami_id for _, ami_id in parsed]},
+                      schema={'topology': pl.Utf8, 'ami_id': pl.List(pl.Utf8)})
+
+    df_coord = read_coordinates(coordinates_path)
+    missing_coordinates = df.join(df_coord, on='topology', how='anti')['topology'].to_list()
+    df = join_coordinates(df, df_coord).select('topology', 'longitude', 'latitude', 'ami_id')
 
     assert(df.n_unique('topology') == len(files))
     log.warning(f"Miss {len(missing_coordinates)} coordinates for following topologies: {missing_coordinates}")
 
     # remove null entries
-    nan_cnt = (df.null_count().select(pl.all()).sum(axis=1).alias('nan')).item()
-    if nan_cnt:
+    if sum(df.null_count().row(0)):
         df = df.drop_nulls()
 
     # save parsed data
     dst_file_path = os.path.join(dst_path, f"{datetime.now().date()}")
     df.write_parquet(dst_file_path)
 
-    log.info(f"Parsed {index} topologies and saved results at {dst_file_path}")
+    log.info(f"Parsed {df.shape[0]} topologies with {df['ami_id'].list.lengths().sum()} AMI ID's and saved results at {dst_file_path}")
 
 
 if __name__ == "__main__":
-    preprocess()
\ No newline at end of file
+    preprocess()
@@ -0,0 +1,123 @@
+import polars as pl
+import os
+
+from lib import Logging, DATA_PATH
+
+log = Logging()
+
+SILVER_PATH = DATA_PATH + f"/silver/"
+FEATURES_PATH = DATA_PATH + f"/bronze/features/production"
+PRICE_PATH = DATA_PATH + f"/raw/price/"
+SPOT_PATH = DATA_PATH + f"/raw/price/spot/"
+VALUATION_PATH = DATA_PATH + f"/gold/valuation"
+
+# hourly spot prices per price area as exported to local parquet or csv files
+SPOT_SCHEMA = {'timestamp': pl.Datetime('us'), 'price_area': pl.Utf8, 'price_eur_mwh': pl.Float64}
+
+VALUE_COLUMNS = ['load_kwh', 'prod_kwh', 'export_kwh', 'import_kwh', 'self_consumption_kwh',
+                 'load_cost_nok', 'import_cost_nok', 'export_revenue_nok', 'self_consumption_value_nok']
+
+
+def _read(file_path: str) -> pl.DataFrame:
+    return pl.read_csv(file_path, try_parse_dates=True) if file_path.endswith('.csv') else pl.read_parquet(file_path)
+
+
+# hourly spot prices of all price areas from the local spot price files
+def read_spot_prices(spot_path: str = SPOT_PATH) -> pl.DataFrame:
+    if not os.path.isdir(spot_path):
+        raise FileNotFoundError(f"no spot price directory at {spot_path}")
+    file_list = sorted(os.path.join(spot_path, file_name) for file_name in os.listdir(spot_path) if os.path.isfile(os.path.join(spot_path, file_name)))
+    if not len(file_list):
+        raise FileNotFoundError(f"no spot price files in {spot_path}")
+    return (pl.concat([_read(file_path).select(list(SPOT_SCHEMA)).cast(SPOT_SCHEMA) for file_path in file_list])
+            .unique(subset=['price_area', 'timestamp'], keep='last'))
+
+
+# hourly EUR to NOK rates upsampled from the daily rates by sandbox/scripts/fetch_valuta.py
+def read_currency_rates(price_path: str = PRICE_PATH) -> pl.DataFrame:
+    if not os.path.isdir(price_path):
+        raise FileNotFoundError(f"no price directory at {price_path}, fetch the currency rates with sandbox/scripts/fetch_valuta.py")
+    file_list = sorted(file_name for file_name in os.listdir(price_path) if file_name.startswith('euro_2_nok_valuta'))
+    if not len(file_list):
+        raise FileNotFoundError(f"no currency rate files in {price_path}, fetch them with sandbox/scripts/fetch_valuta.py")
+    return (pl.concat([pl.read_parquet(os.path.join(price_path, file_name)) for file_name in file_list])
+            .select(pl.col('timestamp').cast(pl.Datetime('us')), pl.col('nok_euro').cast(pl.Float64))
+            .unique(subset='timestamp', keep='last')
+            .sort('timestamp'))
+
+
+# hourly price in NOK/kWh per price area: spot prices with the latest known currency rate of the hour
+def hourly_prices(df_spot: pl.DataFrame, df_rates: pl.DataFrame) -> pl.DataFrame:
+    return (df_spot.sort('timestamp')
+            .join_asof(df_rates, on='timestamp', strategy='backward')
+            .select('price_area', 'timestamp', (pl.col('price_eur_mwh')*pl.col('nok_euro')/1000).alias('price_nok_kwh')))
+
+
+# energy flows of {load} and {prod} (kWh per hour) valued at the hourly price: import and export are the net flows
+# over the grid and self-consumption is the production used behind the meter
+def value_columns(load: pl.Expr, prod: pl.Expr) -> list:
+    export_kwh = pl.max_horizontal(prod - load, pl.lit(0.0))
+    import_kwh = pl.max_horizontal(load - prod, pl.lit(0.0))
+    self_consumption_kwh = pl.min_horizontal(prod, load)
+    price = pl.col('price_nok_kwh')
+
+    return [load.sum().alias('load_kwh'),
+            prod.sum().alias('prod_kwh'),
+            export_kwh.sum().alias('export_kwh'),
+            import_kwh.sum().alias('import_kwh'),
+            self_consumption_kwh.sum().alias('self_consumption_kwh'),
+            (load*price).sum().alias('load_cost_nok'),
+            (import_kwh*price).sum().alias('import_cost_nok'),
+            (export_kwh*price).sum().alias('export_revenue_nok'),
+            (self_consumption_kwh*price).sum().alias('self_consumption_value_nok'),
+            price.is_not_null().sum().alias('priced_hours')]
+
+
+# value of the meters of a topology and of the neighborhood as a whole, where production of one meter covers load of
+# another before being exported. The columns used of the silver table are read and joined with the prices of its
+# price area once, both aggregates are computed from the joined frame.
+def value_topology(silver_file: str, df_prices: pl.DataFrame, price_area: str) -> tuple:
+    df = (pl.scan_parquet(silver_file)
+          .select('meteringPointId', 'fromTime', pl.col('p_load_kwh').fill_null(0), pl.col('p_prod_kwh').fill_null(0))
+          .join(df_prices.lazy().filter(pl.col('price_area') == price_area).drop('price_area'),
+                left_on=pl.col('fromTime').cast(pl.Datetime('us')), right_on='timestamp', how='left')
+          .collect())
+
+    df_meters = df.group_by('meteringPointId').agg(value_columns(pl.col('p_load_kwh'), pl.col('p_prod_kwh')))
+    df_neighborhood = (df.group_by('fromTime')
+                       .agg(pl.col('p_load_kwh').sum(), pl.col('p_prod_kwh').sum(), pl.col('price_nok_kwh').first())
+                       .select(value_columns(pl.col('p_load_kwh'), pl.col('p_prod_kwh'))))
+    return df_meters, df_neighborhood
+
+
+# value load and production of all topologies against the hourly prices of their price area, one topology at a time:
+# meter values are written per topology and the neighborhood values are collected into one table
+def preprocess(silver_path: str = SILVER_PATH, dst_path: str = VALUATION_PATH):
+    df_prices = hourly_prices(read_spot_prices(), read_currency_rates())
+    price_areas = dict(pl.read_parquet(FEATURES_PATH, columns=['topology', 'price_area']).unique(subset='topology').iter_rows())
+
+    meters_path = os.path.join(dst_path, 'meters')
+    os.makedirs(meters_path, exist_ok=True)
+
+    df_neighborhoods = []
+    for index, topology in enumerate(os.listdir(silver_path)):
+        file_path = os.path.join(silver_path, topology)
+        if not os.path.isfile(file_path) or topology == 'features':
+            continue
+        if topology not in price_areas:
+            log.warning(f"[{index}] Skipped valuation of topology {topology} without price area")
+            continue
+
+        df_meters, df_neighborhood = value_topology(file_path, df_prices, price_areas[topology])
+        df_meters.with_columns(topology=pl.lit(topology), price_area=pl.lit(price_areas[topology])).write_parquet(os.path.join(meters_path, topology))
+        df_neighborhoods.append(df_neighborhood.with_columns(topology=pl.lit(topology), price_area=pl.lit(price_areas[topology]),
+                                                             ami_cnt=pl.lit(df_meters.shape[0])))
+        log.info(f"[{index}] Valued {df_meters.shape[0]} AMI's of topology {topology} in price area {price_areas[topology]}")
+
+    df_neighborhoods = pl.concat(df_neighborhoods).select(['topology', 'price_area', 'ami_cnt', *VALUE_COLUMNS, 'priced_hours'])
+    df_neighborhoods.write_parquet(os.path.join(dst_path, 'neighborhoods'))
+    log.info(f"Valued {df_neighborhoods.shape[0]} neighborhoods, saved results at {dst_path}")
+
+
+if __name__ == "__main__":
+    preprocess()
@@ -1,10 +1,17 @@
 from datetime import datetime, timedelta
-import requests, json, os
+import requests, json, os, threading, math
 import polars as pl
 
+from lib import DATA_PATH
+
 time_format = '%Y-%m-%dT%H:%M:%S'
 
-PATH = os.path.dirname(__file__)
+WEATHER_PATH = DATA_PATH + f"/bronze/weather/cells"
+
+# size of a weather grid cell in degrees, topologies within the same cell share one weather series
+WEATHER_GRID_DEGREES = float(os.getenv('WEATHER_GRID_DEGREES', 0.1))
+
+WEATHER_SCHEMA = {'timestamp': pl.Datetime('us'), 'humidity': pl.Float64, 'cloudcover': pl.Float64, 'solarradiation': pl.Float64}
 
 
 def weather_api(latitude: str, longitude: str, date_from: datetime, forecast_range: int)->dict:
@@ -14,26 +21,86 @@ def weather_api(latitude: str, longitude: str, date_from: datetime, forecast_ran
         return response.json()
 
 
+# fetch the days covering the hours [date_from, date_to) from the weather service
+def fetch_weather(latitude: float, longitude: float, date_from: datetime, date_to: datetime) -> dict:
+    forecast_range = ((date_to - timedelta(hours=1)).date() - date_from.date()).days
+    return weather_api(latitude=latitude, longitude=longitude, date_from=date_from, forecast_range=forecast_range)
+
+
+# parse all hours of the response at once into columns
 def parse_weather_api_response(data: dict) -> pl.DataFrame:
-    df = pl.DataFrame(schema={'timestamp':pl.Datetime, 'humidity':pl.Float64, 'cloudcover':pl.Float64, 'solarradiation':pl.Float64})
-    for day in data['days']:
-        for hour in day['hours']:
-            timestamp = datetime.strptime(day['datetime']+'T'+hour['datetime'], time_format)
-            data = {'timestamp':timestamp, 'humidity':hour['humidity'], 'cloudcover':hour['cloudcover'], 'solarradiation':hour['solarradiation']}
-            df = df.vstack(pl.DataFrame(data))
-    return df
+    days = data['days'] if data is not None else []
+    hours = [(day['datetime'], hour) for day in days for hour in day['hours']]
+
+    df = pl.DataFrame({'timestamp': [date + 'T' + hour['datetime'] for date, hour in hours],
+                       'humidity': [hour.get('humidity') for _, hour in hours],
+                       'cloudcover': [hour.get('cloudcover') for _, hour in hours],
+                       'solarradiation': [hour.get('solarradiation') for _, hour in hours]},
+                      schema={'timestamp': pl.Utf8, 'humidity': pl.Float64, 'cloudcover': pl.Float64, 'solarradiation': pl.Float64})
+    return df.with_columns(pl.col('timestamp').str.strptime(pl.Datetime('us'), time_format))
+
+
+# snap a coordinate to the (latitude, longitude) index of its weather grid cell
+def grid_cell(latitude: float, longitude: float, degrees: float = WEATHER_GRID_DEGREES) -> tuple:
+    return math.floor(latitude / degrees), math.floor(longitude / degrees)
+
+
+# hourly weather stored per grid cell, requests only fetch the hours missing in the store and the weather is
+# fetched at the cell center such that nearby topologies share one fetch. {fetch} is called with
+# (latitude, longitude, date_from, date_to) and returns a weather service response.
+class WeatherStore:
+
+    def __init__(self, path: str = WEATHER_PATH, degrees: float = WEATHER_GRID_DEGREES, fetch=fetch_weather):
+        self.path = path
+        self.degrees = degrees
+        self.fetch = fetch
+        self.lock = threading.Lock()
+
+    def cell_path(self, cell: tuple) -> str:
+        return os.path.join(self.path, f"{cell[0]}_{cell[1]}")
+
+    def read_cell(self, cell: tuple) -> pl.DataFrame:
+        path = self.cell_path(cell)
+        if os.path.isfile(path):
+            return pl.read_parquet(path)
+        return pl.DataFrame(schema=WEATHER_SCHEMA)
+
+    def write_cell(self, cell: tuple, df: pl.DataFrame):
+        os.makedirs(self.path, exist_ok=True)
+        path = self.cell_path(cell)
+        df.write_parquet(path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    # hourly weather for a grid cell in the hours [date_from, date_to)
+    def get_cell(self, cell: tuple, date_from: datetime, date_to: datetime) -> pl.DataFrame:
+        date_from = date_from.replace(minute=0, second=0, microsecond=0)
+
+        with self.lock:
+            df = self.read_cell(cell)
+            hours = pl.DataFrame({'timestamp': pl.datetime_range(date_from, date_to, '1h', closed='left', time_unit='us', eager=True)})
+            missing = hours.join(df, on='timestamp', how='anti')['timestamp']
+
+            if len(missing):
+                center = ((cell[0] + 0.5) * self.degrees, (cell[1] + 0.5) * self.degrees)
+                df_ = parse_weather_api_response(self.fetch(center[0], center[1], missing.min(), missing.max() + timedelta(hours=1)))
+                df = (pl.concat([df, df_.cast(WEATHER_SCHEMA)])
+                      .unique(subset='timestamp', keep='last')
+                      .sort('timestamp'))
+                self.write_cell(cell, df)
+
+        return df.filter(pl.col('timestamp').is_between(date_from, date_to, closed='left'))
+
+    # hourly weather for the cell of the coordinate in the hours [date_from, date_to)
+    def get(self, latitude: float, longitude: float, date_from: datetime, date_to: datetime) -> pl.DataFrame:
+        return self.get_cell(grid_cell(latitude, longitude, self.degrees), date_from, date_to)
+
+
+weather = WeatherStore()
 
 
 def query_weather(latitude: str, longitude: str, date_from: datetime, forecast_range: int=7) -> pl.DataFrame:
-    file_name = f"{date_from.date()}-{(date_from+timedelta(days=forecast_range)).date()}_{round(latitude,2)},{round(longitude,2)}"
-    file_path = os.path.join(PATH, f'../data/bronze/weather/{file_name}')
-    if os.path.exists(file_path):
-        df = pl.read_parquet(file_path)
-    else:
-        data = weather_api(latitude=latitude, longitude=longitude, date_from=date_from, forecast_range=forecast_range)
-        df = parse_weather_api_response(data)
-        df.write_parquet(file_path)
-    return df
+    date_from = datetime.combine(date_from.date(), datetime.min.time())
+    return weather.get(latitude=latitude, longitude=longitude, date_from=date_from, date_to=date_from+timedelta(days=forecast_range+1))
 
 if __name__ == "__main__":
     latitude=59.7266804377451
@@ -1,16 +1,21 @@
 import numpy as np
-from flask import Flask, request, render_template, redirect
+from flask import Flask, request, render_template, redirect, url_for
 import polars as pl
-import pandas as pd
 import os
 
-from lib import Logging
+from lib import Logging, lazy_import
+from lib.responses import frame_response, cached_response
+from lib.metrics import instrument, span
+from lib.downsample import downsample, downsample_frame, target_points
 
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+# plotting is only loaded by the html plot routes
+px = lazy_import('plotly.express')
+go = lazy_import('plotly.graph_objects')
+subplots = lazy_import('plotly.subplots')
 
-from lib.etl import etl_bronze_to_silver
+from lib.jobs import jobs
+from lib.sweep import threshold_surface, thresholds, GRID_SIZE_LIMIT
+from lib.queries import SilverMissing, features, silver_features, silver_exists, raw_meters, raw_series, silver_meters, processed_series, duckcurve_profile, raw_sources, silver_sources, features_sources, silver_features_sources, transformer_loading, transformer_loading_sources
 
 log = Logging()
 
@@ -19,21 +24,87 @@ PATH = os.path.dirname(__file__)
 time_format = '%Y-%m-%dT%H:%M:%S'
 
 app = Flask(__name__,template_folder='template')
+instrument(app)
 
 
 # http://0.0.0.0:9000/features?sort_by=ami_prod_cnt&descending=1&show_n=100
+# http://0.0.0.0:9000/features?sort_by=ami_prod_cnt&descending=1&offset=100&show_n=50&columns=topology,ami_cnt,ami_prod_cnt&format=json
 @app.route('/features')
+@cached_response(features_sources)
 def sort_features():
-    path = PATH+f"/data/bronze/features"
-
     descending = request.args.get('descending', default=0, type=int)
     sort_by = request.args.get('sort_by', default='fromTime', type=str)
     show_n = request.args.get('show_n', default=10, type=int)
+    offset = request.args.get('offset', default=0, type=int)
+    columns = request.args.get('columns', default=None, type=str)
+    fmt = request.args.get('format', default='html', type=str)
+
+    df = features()
+    with span('compute'):
+        df = select_page(df, sort_by=sort_by, descending=bool(descending), offset=offset, limit=show_n, columns=columns)
+    return frame_response(df, fmt)
+
+
+# http://0.0.0.0:9000/transformers?sort_by=overload_hours&descending=1&show_n=50
+# http://0.0.0.0:9000/transformers?filter_by=peak_utilization&min=0.8&sort_by=headroom_kva&format=json
+@app.route('/transformers')
+@cached_response(transformer_loading_sources)
+def sort_transformers():
+    descending = request.args.get('descending', default=1, type=int)
+    sort_by = request.args.get('sort_by', default='peak_utilization', type=str)
+    show_n = request.args.get('show_n', default=10, type=int)
+    offset = request.args.get('offset', default=0, type=int)
+    columns = request.args.get('columns', default=None, type=str)
+    filter_by = request.args.get('filter_by', default=None, type=str)
+    lower = request.args.get('min', default=None, type=float)
+    upper = request.args.get('max', default=None, type=float)
+    fmt = request.args.get('format', default='html', type=str)
+
+    df = transformer_loading()
+    if df is None:
+        return {'error': 'no transformer loading table, build it with lib/loading.py'}, 404
+    if filter_by is not None and df.schema.get(filter_by) not in pl.NUMERIC_DTYPES:
+        return {'error': f"unknown numeric column {filter_by} to filter by"}, 400
+
+    with span('compute'):
+        if filter_by is not None:
+            df = df.filter(pl.col(filter_by).is_between(lower if lower is not None else float('-inf'), upper if upper is not None else float('inf')))
+        df = select_page(df, sort_by=sort_by, descending=bool(descending), offset=offset, limit=show_n, columns=columns)
+    return frame_response(df, fmt)
+
+
+# top-k selection of a page of rows instead of a full sort of the table
+def select_page(df: pl.DataFrame, sort_by: str, descending: bool, offset: int, limit: int, columns: str = None) -> pl.DataFrame:
+    offset, limit = max(offset, 0), max(limit, 0)
 
-    df = pl.read_parquet(os.path.join(path,'production'))
     if sort_by is not None and sort_by in df.columns:
-        return df.sort(by=sort_by, descending=bool(descending)).head(show_n).to_pandas().to_html()
-    return df.head(show_n).to_pandas().to_html()
+        # top_k returns the k largest rows, inverted when an ascending order is requested. Nulls are taken apart and
+        # put first as by the full sort, top_k does not order them consistently.
+        df_nulls = df.filter(pl.col(sort_by).is_null()).head(offset+limit)
+        df = pl.concat([df_nulls,
+                        df.filter(pl.col(sort_by).is_not_null())
+                          .top_k(offset+limit-df_nulls.height, by=sort_by, descending=not descending)
+                          .sort(by=sort_by, descending=descending)])
+    df = df.slice(offset, limit)
+
+    if columns not in ['', None]:
+        df = df.select([column for column in columns.split(',') if column in df.columns])
+    return df
+
+
+# submit a background silver build for a topology missing silver, and render a page polling for the build
+def pending_silver(topology: str, date_from: str = '2023-03-01T00:00:00', date_to: str = '2023-09-01T00:00:00'):
+    job = jobs.submit_silver(topology, date_from, date_to)
+    if request.path.startswith('/api/'):
+        return job.to_dict(), 202, {'Location': url_for('job_status', job_id=job.id)}
+    return render_template('pending.html', topology=topology, job=job.to_dict(), job_url=url_for('job_status', job_id=job.id)), 202
+
+
+# silver removed or replaced between the check of a route and its read is built in the background as if it was missing
+@app.errorhandler(SilverMissing)
+def silver_missing(e: SilverMissing):
+    return pending_silver(e.topology, date_from=request.args.get('date_from', default='2023-03-01T00:00:00', type=str),
+                          date_to=request.args.get('date_to', default='2023-09-01T00:00:00', type=str))
 
 
 def set_px(fig_cnt:int=1):
@@ -41,58 +112,76 @@ def set_px(fig_cnt:int=1):
     px.defaults.height = 1080*0.9/fig_cnt
 
 
+# x/y arrays of a line trace downsampled to the figure width, disabled for exports with downsample=0
+def trace(df: pl.DataFrame, y: str, x: str = 'fromTime', sign: int = 1) -> dict:
+    with span('convert'):
+        x_values, y_values = df[x].to_numpy(), sign*df[y].to_numpy()
+    if request.args.get('downsample', default=1, type=int):
+        with span('compute'):
+            method = request.args.get('method', default='lttb', type=str)
+            index = downsample(df[x], y_values, n_out=target_points(px.defaults.width), method=method)
+            x_values, y_values = x_values[index], y_values[index]
+    return dict(x=x_values, y=y_values)
+
+
+# downsample the series of the data api to {points} per column when requested
+def api_points(df: pl.DataFrame, columns: list, by: str = None) -> pl.DataFrame:
+    points = request.args.get('points', default=None, type=int)
+    if points is None or df.is_empty():
+        return df
+
+    method = request.args.get('method', default='lttb', type=str)
+    with span('compute'):
+        if by is None:
+            return downsample_frame(df, 'fromTime', columns, n_out=points, method=method)
+        return pl.concat([downsample_frame(df_, 'fromTime', columns, n_out=points, method=method) for _, df_ in df.group_by(by, maintain_order=True)])
+
+
 # plot the raw data for visual inspection
 # http://0.0.0.0:9000/plot/raw?topology=S_1262876_T_1262881&ami=707057500080789520
 @app.route('/plot/raw')
+@cached_response(lambda: raw_sources(request.args.get('topology', type=str)))
 def plot_raw_ami():
-    path = PATH+f"/data/bronze/measurements"
-
     topology = request.args.get('topology', type=str)
     ami = request.args.get('ami', type=str)
 
     if topology in ['',None]:
         return redirect('/features?sort_by=ami_prod_cnt&descending=1&show_n=200')
 
-    for file_name in os.listdir(path):
-        if topology in file_name.split(sep='_2023')[0]:
-            df = pl.read_parquet(os.path.join(path, file_name)).with_columns(topology = pl.lit(topology))
-            break
-
     if ami in ['',None]:
-        return df.unique(subset=['meteringPointId','type']).select('meteringPointId','type').sort(by='meteringPointId').to_pandas().to_html()
-
-    df = df.filter(pl.col('meteringPointId') == ami)
-
-    df_p_load = df.filter(pl.col('type')==1).select(['fromTime','value','unit']).sort(by='fromTime').to_pandas()
-    df_p_prod = df.filter(pl.col('type')==3).select(['fromTime','value','unit']).sort(by='fromTime').to_pandas()
-
-    set_px(1)
-
-    # plot consumption
-    fig1 = px.line(x=df_p_load['fromTime'], y=-df_p_load['value'])
-    fig1.data[0].showlegend = True
-    fig1.data[0].name = 'Consumption'
-    if df_p_prod.shape[0]:
-        fig1.add_scatter(x=df_p_prod['fromTime'], y=df_p_prod['value'])
-        fig1.data[1].showlegend = True
-        fig1.data[1].name = 'Production'
-    fig1.update_yaxes(title_text='kWh/h')
-    fig1.update_xaxes(title_text='time')
-    fig1.update_layout(
-        title=dict(text=f"Time series for AMI={ami}, Topology={topology}", x=0.5, y=0.95, font=dict(size=18, color='black'), xanchor='center')
-    )
+        return frame_response(raw_meters(topology))
+
+    df = raw_series(topology, ami)
+    df_p_load = df.filter(pl.col('type')==1).select(['fromTime','value','unit'])
+    df_p_prod = df.filter(pl.col('type')==3).select(['fromTime','value','unit'])
+
+    with span('render'):
+        set_px(1)
+
+        # plot consumption
+        fig1 = px.line(**trace(df_p_load, 'value', sign=-1))
+        fig1.data[0].showlegend = True
+        fig1.data[0].name = 'Consumption'
+        if df_p_prod.shape[0]:
+            fig1.add_scatter(**trace(df_p_prod, 'value'))
+            fig1.data[1].showlegend = True
+            fig1.data[1].name = 'Production'
+        fig1.update_yaxes(title_text='kWh/h')
+        fig1.update_xaxes(title_text='time')
+        fig1.update_layout(
+            title=dict(text=f"Time series for AMI={ami}, Topology={topology}", x=0.5, y=0.95, font=dict(size=18, color='black'), xanchor='center')
+        )
 
-    # Render the plots
-    plot_div1 = fig1.to_html(full_html=False)
+        # Render the plots
+        plot_div1 = fig1.to_html(full_html=False)
 
     return render_template('raw.html', plot_div1=plot_div1)
 
 # Plot the processed time series for aggegrgaed and average production and consumption for a neighborhood
 # http://0.0.0.0:9000/plot/processed?topology=S_1262876_T_1262881&every=1h
 @app.route('/plot/processed')
+@cached_response(lambda: silver_sources(request.args.get('topology', type=str)))
 def plot_processed():
-    silver_path = PATH+f"/data/silver/"
-
     topology = request.args.get('topology', type=str)
     ami = request.args.get('ami', type=str)
 
@@ -100,248 +189,342 @@ def plot_processed():
     date_from = request.args.get('date_from', default='2023-03-01T00:00:00', type=str)
     date_to =  request.args.get('date_to', default='2023-09-01T00:00:00', type=str)
 
-    # initial raw read and pre-filter of measurents in appropriate range
-    if os.path.isfile(os.path.join(silver_path, topology)):
-        df = pl.read_parquet(os.path.join(silver_path, topology))
-    else:
-        df = etl_bronze_to_silver(topology,date_from=date_from,date_to=date_to)
-
-    unique_ami = df.unique(subset='meteringPointId').select(pl.col('meteringPointId'))
-    if ami is not None:
-        if ami not in unique_ami.to_series().to_list():
-            return unique_ami.to_pandas().to_html()
-        else:
-            df = df.filter(pl.col('meteringPointId')==ami)
+    if not silver_exists(topology):
+        return pending_silver(topology, date_from=date_from, date_to=date_to)
 
+    df = processed_series(topology, every=every, ami=ami, date_from=date_from, date_to=date_to)
+    if df is None:
+        return frame_response(silver_meters(topology))
 
     # total production and consumption over cluster of prosumers grouped by hourly timestamp
-    ami_cnt = df.n_unique(subset='meteringPointId')
-
-    # calculate aggregated and average of columns
-    df = df.sort(by=['fromTime']).group_by_dynamic('fromTime', every=every).agg(
-        pl.col('p_load_kwh').sum().alias('p_load_sum_kwh'),
-        (pl.col('p_load_kwh').sum()/ami_cnt).alias('p_load_avg_kwh'),
-        pl.col('p_prod_kwh').sum().alias('p_prod_sum_kwh'),
-        (pl.col('p_prod_kwh').sum()/ami_cnt).alias('p_prod_avg_kwh'),
-        (pl.col('p_prod_kwh')-pl.col('p_load_kwh')).sum().alias('p_export_sum_kwh'),
-        ((pl.col('p_prod_kwh')-pl.col('p_load_kwh')).sum()/ami_cnt).alias('p_export_avg_kwh')
-    )
-
-    set_px(2)
-
-    # plot aggregated neighborhood profiles
-    fig1 = px.line(x=df['fromTime'], y=-df['p_load_sum_kwh'])
-    fig1.add_scatter(x=df['fromTime'], y=df['p_prod_sum_kwh'])
-    fig1.add_scatter(x=df['fromTime'], y=df['p_export_sum_kwh'])
-
-    fig1.update_yaxes(title_text='kWh/{every}')
-    fig1.update_xaxes(title_text='time')
-    fig1.update_layout(
-        title=dict(text=f"Aggregated profiles for topology {topology} (aggregation period={every})", x=0.5, y=0.95, font=dict(size=18, color='black'), xanchor='center')
-    )
-
-    # Add legend items
-    fig1.data[0].showlegend = True
-    fig1.data[0].name = 'Consumption'
-    fig1.data[1].showlegend = True
-    fig1.data[1].name = 'Production'
-    fig1.data[2].showlegend = True
-    fig1.data[2].name = 'Grid Export'
-
-    # Averaged profiles for topology
-    fig2 = px.line(x=df['fromTime'], y=-df['p_load_avg_kwh'])
-    fig2.add_scatter(x=df['fromTime'], y=df['p_prod_avg_kwh'])
-    fig2.add_scatter(x=df['fromTime'], y=df['p_export_avg_kwh'])
-
-    fig2.update_yaxes(title_text='kWh/{every}')
-    fig2.update_xaxes(title_text='time')
-    fig2.update_layout(
-        title=dict(text=f"Averaged profiles for topology {topology} (averaged over {ami_cnt} AMI's)", x=0.5, y=0.95, font=dict(size=18, color='black'), xanchor='center')
-    )
-
-    # Add legend items
-    fig2.data[0].showlegend = True
-    fig2.data[0].name = 'Consumption'
-    fig2.data[1].showlegend = True
-    fig2.data[1].name = 'Production'
-    fig2.data[2].showlegend = True
-    fig2.data[2].name = 'Grid Export'
-
-    # Render the plots
-    plot_div1 = fig1.to_html(full_html=False)
-    plot_div2 = fig2.to_html(full_html=False)
+    ami_cnt = df.select(pl.col('ami_cnt').max()).item()
+
+    with span('render'):
+        set_px(2)
+
+        # plot aggregated neighborhood profiles
+        fig1 = px.line(**trace(df, 'p_load_sum_kwh', sign=-1))
+        fig1.add_scatter(**trace(df, 'p_prod_sum_kwh'))
+        fig1.add_scatter(**trace(df, 'p_export_sum_kwh'))
+
+        fig1.update_yaxes(title_text='kWh/{every}')
+        fig1.update_xaxes(title_text='time')
+        fig1.update_layout(
+            title=dict(text=f"Aggregated profiles for topology {topology} (aggregation period={every})", x=0.5, y=0.95, font=dict(size=18, color='black'), xanchor='center')
+        )
+
+        # Add legend items
+        fig1.data[0].showlegend = True
+        fig1.data[0].name = 'Consumption'
+        fig1.data[1].showlegend = True
+        fig1.data[1].name = 'Production'
+        fig1.data[2].showlegend = True
+        fig1.data[2].name = 'Grid Export'
+
+        # Averaged profiles for topology
+        fig2 = px.line(**trace(df, 'p_load_avg_kwh', sign=-1))
+        fig2.add_scatter(**trace(df, 'p_prod_avg_kwh'))
+        fig2.add_scatter(**trace(df, 'p_export_avg_kwh'))
+
+        fig2.update_yaxes(title_text='kWh/{every}')
+        fig2.update_xaxes(title_text='time')
+        fig2.update_layout(
+            title=dict(text=f"Averaged profiles for topology {topology} (averaged over {ami_cnt} AMI's)", x=0.5, y=0.95, font=dict(size=18, color='black'), xanchor='center')
+        )
+
+        # Add legend items
+        fig2.data[0].showlegend = True
+        fig2.data[0].name = 'Consumption'
+        fig2.data[1].showlegend = True
+        fig2.data[1].name = 'Production'
+        fig2.data[2].showlegend = True
+        fig2.data[2].name = 'Grid Export'
+
+        # Render the plots
+        plot_div1 = fig1.to_html(full_html=False)
+        plot_div2 = fig2.to_html(full_html=False)
 
     return render_template('processed.html', plot_div1=plot_div1, plot_div2=plot_div2)
 
 # Plot the processed time series for aggegrgaed and average production and consumption for a neighborhood
 # http://0.0.0.0:9000/plot/duckcurve?topology=S_1262876_T_1262881
 @app.route('/plot/duckcurve')
+@cached_response(lambda: silver_sources(request.args.get('topology', type=str)))
 def plot_duckcurve():
-
-    path = PATH+f"/data/silver/"
-
     topology = request.args.get('topology', type=str)
     if topology in ['', None]:
         return redirect('/features?sort_by=ami_prod_cnt&descending=1&show_n=200')
 
-    df = pl.read_parquet(os.path.join(path, topology))
-    load_cnt = df.filter(pl.col('p_load_kwh')>0).n_unique('meteringPointId')
-    prod_cnt = df.filter(pl.col('p_prod_kwh')>0).n_unique('meteringPointId')
-
-    ami_cnt = df.n_unique('meteringPointId')
-    # group AMI's for neighborhood over {every} and solve for total of group
-    every = '1h'
-    df = df.sort(by=['fromTime']).group_by_dynamic('fromTime', every=every) \
-        .agg(pl.col('p_load_kwh').sum().alias('nb_load'),
-             pl.col('p_prod_kwh').sum().alias('nb_prod')) \
-        .with_columns((pl.col('fromTime').map_elements(lambda datetime: datetime.hour)).alias('hour'))
-
-    df_=df.group_by(by='hour').agg(pl.col('nb_load').max().alias('nb_load_max'),
-                                   pl.col('nb_load').mean().alias('nb_load_avg'),
-                                   pl.col('nb_prod').max().alias('nb_prod_max')
-                                   ).sort(by='hour')
-
-    df_=df_.with_columns([(pl.col('nb_load_max')-pl.col('nb_prod_max')).alias('nb_duck_max'),
-                          ((pl.col('nb_load_max')-pl.col('nb_prod_max'))/pl.col('nb_load_avg')*100).alias('nb_nduck_max')])
-
-    # Create figure with secondary y-axis
-    fig1 = make_subplots(specs=[[{"secondary_y": True}]])
-
-    # Add traces
-
-    fig1.add_trace(
-        go.Scatter(x=df_['hour'], y=df_['nb_load_max'], name=f"Load (#AMI={load_cnt})", line=dict(color="#FFC000")),
-        secondary_y=False,
-    )
-
-    fig1.add_trace(
-        go.Scatter(x=df_['hour'], y=df_['nb_prod_max'], name=f"Prod (#AMI={prod_cnt})", line=dict(color="#006400")),
-        secondary_y=True,
-    )
-
-
-    # Add figure title
-    fig1.update_layout(
-        title=dict(text=f"Hourly aggregated profiles for <{topology}>", xanchor='left'),
-        width=1920*.9,
-        height=1080*.45,
-        legend=dict(
-            yanchor="top",
-            y=0.99,
-            xanchor="left",
-            x=0.01
-        ),
-        font=dict(
-            family="Courier New, monospace",
-            size=18,
-            color="#000000"
+    if not silver_exists(topology):
+        return pending_silver(topology)
+
+    df_ = duckcurve_profile(topology)
+    load_cnt = df_.select(pl.col('ami_load_cnt').first()).item()
+    prod_cnt = df_.select(pl.col('ami_prod_cnt').first()).item()
+
+    with span('render'):
+        # Create figure with secondary y-axis
+        fig1 = subplots.make_subplots(specs=[[{"secondary_y": True}]])
+
+        # Add traces
+
+        fig1.add_trace(
+            go.Scatter(x=df_['hour'], y=df_['nb_load_max'], name=f"Load (#AMI={load_cnt})", line=dict(color="#FFC000")),
+            secondary_y=False,
+        )
+
+        fig1.add_trace(
+            go.Scatter(x=df_['hour'], y=df_['nb_prod_max'], name=f"Prod (#AMI={prod_cnt})", line=dict(color="#006400")),
+            secondary_y=True,
+        )
+
+
+        # Add figure title
+        fig1.update_layout(
+            title=dict(text=f"Hourly aggregated profiles for <{topology}>", xanchor='left'),
+            width=1920*.9,
+            height=1080*.45,
+            legend=dict(
+                yanchor="top",
+                y=0.99,
+                xanchor="left",
+                x=0.01
+            ),
+            font=dict(
+                family="Courier New, monospace",
+                size=18,
+                color="#000000"
+            )
         )
-    )
-
-    # Set x-axis title
-    fig1.update_xaxes(title_text="time [h]")
-
-    # Set y-axes titles
-    fig1.update_yaxes(title_text="Avg. Nhbd. Load kWh/h", secondary_y=False, color="#FFC000")
-    fig1.update_yaxes(title_text="Avg. Nhbd. Prod kWh/h", secondary_y=True, color="#006400")
-
-    #
-    # Plot duck curve net and normalize
-    #
-    fig2 = make_subplots(specs=[[{"secondary_y": True}]])
-
-    # Add traces
-
-    fig2.add_trace(
-        go.Scatter(x=df_['hour'], y=df_['nb_duck_max'], name=f"Duck", line=dict(color="#00008B")),
-        secondary_y=False,
-    )
-
-    fig2.add_trace(
-        go.Scatter(x=df_['hour'], y=df_['nb_nduck_max'], name=f"Norm. Duck (Avg. Load)", line=dict(color="#D3D3D3")),
-        secondary_y=True,
-    )
-
-    # Add figure title
-    fig2.update_layout(
-        title=dict(text=f"Hourly aggregated profiles for <{topology}>", xanchor='left'),
-        width=1920*.9,
-        height=1080*.45,
-        legend=dict(
-            yanchor="top",
-            y=0.99,
-            xanchor="left",
-            x=0.01
-        ),
-        font=dict(
-            family="Courier New, monospace",
-            size=18,
-            color="#000000"
+
+        # Set x-axis title
+        fig1.update_xaxes(title_text="time [h]")
+
+        # Set y-axes titles
+        fig1.update_yaxes(title_text="Avg. Nhbd. Load kWh/h", secondary_y=False, color="#FFC000")
+        fig1.update_yaxes(title_text="Avg. Nhbd. Prod kWh/h", secondary_y=True, color="#006400")
+
+        #
+        # Plot duck curve net and normalize
+        #
+        fig2 = subplots.make_subplots(specs=[[{"secondary_y": True}]])
+
+        # Add traces
+
+        fig2.add_trace(
+            go.Scatter(x=df_['hour'], y=df_['nb_duck_max'], name=f"Duck", line=dict(color="#00008B")),
+            secondary_y=False,
         )
-    )
 
-    # Set x-axis title
-    fig2.update_xaxes(title_text="time [h]")
+        fig2.add_trace(
+            go.Scatter(x=df_['hour'], y=df_['nb_nduck_max'], name=f"Norm. Duck (Avg. Load)", line=dict(color="#D3D3D3")),
+            secondary_y=True,
+        )
+
+        # Add figure title
+        fig2.update_layout(
+            title=dict(text=f"Hourly aggregated profiles for <{topology}>", xanchor='left'),
+            width=1920*.9,
+            height=1080*.45,
+            legend=dict(
+                yanchor="top",
+                y=0.99,
+                xanchor="left",
+                x=0.01
+            ),
+            font=dict(
+                family="Courier New, monospace",
+                size=18,
+                color="#000000"
+            )
+        )
+
+        # Set x-axis title
+        fig2.update_xaxes(title_text="time [h]")
+
+        # Set y-axes titles
+        fig2.update_yaxes(title_text="Net kWh/h", secondary_y=False, color="#000000")
+        fig2.update_yaxes(title_text="Norm. %", secondary_y=True, color="#D3D3D3")
 
-    # Set y-axes titles
-    fig2.update_yaxes(title_text="Net kWh/h", secondary_y=False, color="#000000")
-    fig2.update_yaxes(title_text="Norm. %", secondary_y=True, color="#D3D3D3")
+        plot_div1 = fig1.to_html(full_html=False)
+        plot_div2 = fig2.to_html(full_html=False)
 
-    return render_template('processed.html', plot_div1=fig1.to_html(full_html=False), plot_div2=fig2.to_html(full_html=False))
+    return render_template('processed.html', plot_div1=plot_div1, plot_div2=plot_div2)
 
 # pre-screening neighborhood selection
 # http://0.0.0.0:9000/plot/prescreening
 @app.route('/plot/prescreening')
+@cached_response(silver_features_sources)
 def prescreening():
-    path = PATH+f"/data/silver/"
-
     nb_aggmaxp_val = request.args.get('nb_aggmaxp_val', default=1,  type=float)
 
-    df_pl = pl.read_parquet(os.path.join(path,'features'))
+    df_pl = silver_features()
     prod_cnt_list = np.linspace(1,
                                 df_pl.select(pl.col('ami_prod_cnt').max()).item(),
                                 df_pl.select(pl.col('ami_prod_cnt').max()).item())
 
-    df_pd = pd.DataFrame(columns=['prod_ami_cnt','#Neighborhoods'])
+    with span('compute'):
+        df_pd = threshold_surface(df_pl, x='ami_prod_cnt', y='nb_aggmaxp_val', x_thresholds=prod_cnt_list, y_thresholds=[nb_aggmaxp_val]) \
+            .select(pl.col('ami_prod_cnt').alias('prod_ami_cnt'), pl.col('nb_cnt').alias('#Neighborhoods'))
+
+        # number of neighborhoods over the full threshold surface
+        df_surface = threshold_surface(df_pl, x='ami_prod_cnt', y='nb_aggmaxp_val')
+
+    with span('convert'):
+        df_pd = df_pd.to_pandas()
+
+    with span('render'):
+        set_px(1)
+
+        # plot consumption
+        fig = px.bar(df_pd, x='prod_ami_cnt', y='#Neighborhoods',color='#Neighborhoods')
+
+        fig.update_layout(
+            )
+
+        # Add figure title
+        fig.update_yaxes(type="log", row=1, col=1)
+
+        fig.update_layout(
+            title=f"#Neighborhood with #Plusskunder exceeding {nb_aggmaxp_val} kWh/h hourly aggregated production",
+            yaxis_title=' Number of Neighborhoods (log scale)',
+            xaxis_title=r'Number of Plusskunder',
+            width=1920*.9,
+            height=1080*.85,
+            legend=dict(
+                yanchor="top",
+                y=0.99,
+                xanchor="left",
+                x=0.01
+            ),
+            font=dict(
+                family="Courier New, monospace",
+                size=18,
+                color="#000000"
+            )
+        )
 
-    for prod_ami_cnt in prod_cnt_list:
-            topology_cnt = df_pl.filter(pl.col('ami_prod_cnt')>=prod_ami_cnt).filter(pl.col('nb_aggmaxp_val')>=nb_aggmaxp_val).n_unique('topology')
-            df_pd.loc[len(df_pd.index)] = [prod_ami_cnt,topology_cnt]
+        fig2 = go.Figure(go.Heatmap(x=df_surface['ami_prod_cnt'], y=df_surface['nb_aggmaxp_val'], z=np.log10(df_surface['nb_cnt'].to_numpy()+1),
+                                    customdata=df_surface['nb_cnt'], hovertemplate='#Plusskunder>=%{x}<br>kWh/h>=%{y}<br>#Neighborhoods=%{customdata}<extra></extra>',
+                                    colorbar=dict(title='log10(#Nbhd.)')))
+        fig2.update_layout(
+            title="#Neighborhoods with #Plusskunder and hourly aggregated production exceeding thresholds",
+            yaxis_title='Aggregated production kWh/h',
+            xaxis_title='Number of Plusskunder',
+            width=1920*.9,
+            height=1080*.85,
+            font=dict(
+                family="Courier New, monospace",
+                size=18,
+                color="#000000"
+            )
+        )
 
-    set_px(1)
+        # Render the plots
+        plot_div1 = fig.to_html(full_html=False)
+        plot_div2 = fig2.to_html(full_html=False)
 
-    # plot consumption
-    fig = px.bar(df_pd, x='prod_ami_cnt', y='#Neighborhoods',color='#Neighborhoods')
+    return render_template('processed.html', plot_div1=plot_div1, plot_div2=plot_div2)
 
-    fig.update_layout(
-        )
 
-    # Add figure title
-    fig.update_yaxes(type="log", row=1, col=1)
-
-    fig.update_layout(
-        title=f"#Neighborhood with #Plusskunder exceeding {nb_aggmaxp_val} kWh/h hourly aggregated production",
-        yaxis_title=' Number of Neighborhoods (log scale)',
-        xaxis_title=r'Number of Plusskunder',
-        width=1920*.9,
-        height=1080*.85,
-        legend=dict(
-            yanchor="top",
-            y=0.99,
-            xanchor="left",
-            x=0.01
-        ),
-        font=dict(
-            family="Courier New, monospace",
-            size=18,
-            color="#000000"
-        )
-    )
+# Data api returning the series behind the plots as columnar json (default) or compressed arrow ipc (format=arrow)
+# http://0.0.0.0:9000/api/raw?topology=S_1262876_T_1262881&ami=707057500080789520
+@app.route('/api/raw')
+@cached_response(lambda: raw_sources(request.args.get('topology', type=str)))
+def api_raw():
+    topology = request.args.get('topology', type=str)
+    ami = request.args.get('ami', type=str)
+    fmt = request.args.get('format', default='json', type=str)
+
+    if topology in ['',None]:
+        return {'error': 'missing topology argument'}, 400
+
+    if ami in ['',None]:
+        return frame_response(raw_meters(topology), fmt)
+    return frame_response(api_points(raw_series(topology, ami), columns=['value'], by='type'), fmt)
+
+
+# http://0.0.0.0:9000/api/processed?topology=S_1262876_T_1262881&every=1d&format=arrow
+@app.route('/api/processed')
+@cached_response(lambda: silver_sources(request.args.get('topology', type=str)))
+def api_processed():
+    topology = request.args.get('topology', type=str)
+    ami = request.args.get('ami', type=str)
+    every = request.args.get('every', default='1h', type=str)
+    date_from = request.args.get('date_from', default='2023-03-01T00:00:00', type=str)
+    date_to =  request.args.get('date_to', default='2023-09-01T00:00:00', type=str)
+    fmt = request.args.get('format', default='json', type=str)
+
+    if topology in ['',None]:
+        return {'error': 'missing topology argument'}, 400
+
+    if not silver_exists(topology):
+        return pending_silver(topology, date_from=date_from, date_to=date_to)
+
+    df = processed_series(topology, every=every, ami=ami, date_from=date_from, date_to=date_to)
+    if df is None:
+        return {'error': f"unknown ami {ami} in topology {topology}"}, 404
+    return frame_response(api_points(df, columns=['p_load_sum_kwh', 'p_prod_sum_kwh', 'p_export_sum_kwh']), fmt)
+
+
+# http://0.0.0.0:9000/api/duckcurve?topology=S_1262876_T_1262881
+@app.route('/api/duckcurve')
+@cached_response(lambda: silver_sources(request.args.get('topology', type=str)))
+def api_duckcurve():
+    topology = request.args.get('topology', type=str)
+    fmt = request.args.get('format', default='json', type=str)
+
+    if topology in ['',None]:
+        return {'error': 'missing topology argument'}, 400
+
+    if not silver_exists(topology):
+        return pending_silver(topology)
+    return frame_response(duckcurve_profile(topology), fmt)
+
+
+# Number of neighborhoods over a 2-D grid of thresholds on two feature columns for heatmap rendering
+# http://0.0.0.0:9000/api/prescreening?x=ami_prod_cnt&y=nb_aggmaxp_val&x_n=50&y_n=50
+@app.route('/api/prescreening')
+@cached_response(silver_features_sources)
+def api_prescreening():
+    x = request.args.get('x', default='ami_prod_cnt', type=str)
+    y = request.args.get('y', default='nb_aggmaxp_val', type=str)
+    x_n = request.args.get('x_n', default=GRID_SIZE_LIMIT, type=int)
+    y_n = request.args.get('y_n', default=GRID_SIZE_LIMIT, type=int)
+    fmt = request.args.get('format', default='json', type=str)
+
+    df = silver_features()
+    if x not in df.columns or y not in df.columns:
+        return {'error': f"unknown feature columns {x}, {y}"}, 400
+
+    x_thresholds = thresholds(df[x].drop_nulls().to_numpy(), n=x_n)
+    y_thresholds = thresholds(df[y].drop_nulls().to_numpy(), n=y_n)
+    return frame_response(threshold_surface(df, x=x, y=y, x_thresholds=x_thresholds, y_thresholds=y_thresholds), fmt)
+
+
+# Status of a background job, e.g. a silver build
+# http://0.0.0.0:9000/jobs/silver:S_1262876_T_1262881
+@app.route('/jobs/<job_id>')
+def job_status(job_id: str):
+    status = jobs.status(job_id)
+    if status is None:
+        return {'error': f"unknown job {job_id}"}, 404
+    return status
+
+
+# Client side rendered plots which fetch their series from the data api
+# http://0.0.0.0:9000/view/processed?topology=S_1262876_T_1262881&every=1h
+@app.route('/view/<any(raw, processed, duckcurve):view>')
+def plot_client(view: str):
+    topology = request.args.get('topology', type=str)
+    if topology in ['',None]:
+        return redirect('/features?sort_by=ami_prod_cnt&descending=1&show_n=200')
 
-    # Render the plots
-    plot_div = fig.to_html(full_html=False)
+    if view == 'raw' and request.args.get('ami', default='', type=str) == '':
+        return redirect(url_for('plot_raw_ami', topology=topology))
 
-    return render_template('raw.html', plot_div1=plot_div)
+    data_url = url_for(f"api_{view}", **{**request.args.to_dict(), 'format': 'json'})
+    return render_template('client.html', view=view, data_url=data_url, params=request.args.to_dict())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,62 @@
+from lxml import etree
+import argparse, os, resource, subprocess, sys, time
+
+PATH = os.path.dirname(__file__)
+sys.path.append(os.path.join(PATH, '../..'))
+
+CIM_NS = 'http://iec.ch/TC57/2013/CIM-schema-cim16#'
+RDF_NS = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+
+
+# synthetic CIM export of roughly {size_mb} MB with one transformer between line segments and usage points
+def generate(path: str, size_mb: int):
+    with open(path, 'w') as fp:
+        fp.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<rdf:RDF xmlns:cim="{CIM_NS}" xmlns:rdf="{RDF_NS}">\n')
+        fp.write('<cim:PowerTransformer rdf:ID="_tf"><cim:IdentifiedObject.mRID>tf-1</cim:IdentifiedObject.mRID>'
+                 '<cim:IdentifiedObject.name>T_1</cim:IdentifiedObject.name><cim:PowerSystemResource.operationlabel>500 kVA</cim:PowerSystemResource.operationlabel></cim:PowerTransformer>\n')
+        for end in [1, 2]:
+            fp.write(f'<cim:PowerTransformerEnd rdf:ID="_tfe{end}"><cim:TransformerEnd.endNumber>{end}</cim:TransformerEnd.endNumber>'
+                     f'<cim:PowerTransformerEnd.ratedU>{22000 if end == 1 else 230}</cim:PowerTransformerEnd.ratedU><cim:PowerTransformerEnd.ratedS>500</cim:PowerTransformerEnd.ratedS></cim:PowerTransformerEnd>\n')
+        index = 0
+        while fp.tell() < size_mb*1024*1024:
+            fp.write(f'<cim:ACLineSegment rdf:ID="_l{index}"><cim:IdentifiedObject.mRID>l-{index}</cim:IdentifiedObject.mRID><cim:IdentifiedObject.name>line {index}</cim:IdentifiedObject.name>'
+                     f'<cim:Conductor.length>{index % 400}</cim:Conductor.length><cim:ACLineSegment.r>0.{index % 97}</cim:ACLineSegment.r></cim:ACLineSegment>\n'
+                     f'<cim:UsagePoint rdf:ID="_u{index}"><cim:IdentifiedObject.mRID>u-{index}</cim:IdentifiedObject.mRID><cim:IdentifiedObject.name>70705750{index:010d}</cim:IdentifiedObject.name></cim:UsagePoint>\n')
+            index += 1
+        fp.write('</rdf:RDF>\n')
+
+
+# previous in-memory parser with full tree and findall
+def parse_tree(path: str) -> dict:
+    root = etree.parse(path).getroot()
+    tf = {}
+    for element in root.findall('cim:PowerTransformer', root.nsmap):
+        tf['mrid'] = element.find('cim:IdentifiedObject.mRID', root.nsmap).text
+    for element in root.findall('cim:PowerTransformerEnd', root.nsmap):
+        tf[element.find('cim:TransformerEnd.endNumber', root.nsmap).text] = element.find('cim:PowerTransformerEnd.ratedS', root.nsmap).text
+    return tf
+
+
+# python bench_transformers.py --size 200
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Throughput and peak memory of the CIM transformer parsers')
+    parser.add_argument('--size', default=200, type=int, help='size of the synthetic CIM file in MB')
+    parser.add_argument('--path', default='/tmp/synthetic_cim.xml')
+    parser.add_argument('--method', default=None, choices=['tree', 'stream'])
+    args = parser.parse_args()
+
+    if args.method is None:
+        if not os.path.isfile(args.path) or os.path.getsize(args.path) < args.size*1024*1024:
+            generate(args.path, args.size)
+        # measure each parser in a fresh process such that the peak memory is not shared
+        for method in ['tree', 'stream']:
+            subprocess.run([sys.executable, __file__, '--size', str(args.size), '--path', args.path, '--method', method], check=True)
+    else:
+        from lib.transformers import transformer_fields
+
+        t0 = time.perf_counter()
+        tf = parse_tree(args.path) if args.method == 'tree' else transformer_fields(args.path)
+        elapsed = time.perf_counter()-t0
+        size_mb = os.path.getsize(args.path)/1024/1024
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+        print(f"{args.method:<8} {size_mb:.0f} MB in {elapsed:.2f}s ({size_mb/elapsed:.1f} MB/s), peak RSS {peak_mb:.0f} MB, parsed {tf}")
@@ -2,6 +2,9 @@ import numpy as np
 import polars as pl
 import os, json
 
+from lib.scenarios import Rule, evaluate
+from lib.catalog import catalog
+
 PATH = os.getcwd()
 path = f"{PATH}/../../data/bronze/features/"
 
@@ -39,17 +42,23 @@ def r6_filter_for_neighborhood_net_export_to_peak_load(df: pl.DataFrame, lower_l
     return df
 
 
-# Scenario
-def scenario(df: pl.DataFrame, scenario_args: dict) -> dict:
-    df = r1_filter_penetration(df, scenario_args['r1_lb'])
-    df = r2_filter_ami_cnt_lower_limit(df, scenario_args['r2_lb'])
-    df = r3_filter_ami_prod_cnt_lower_limit(df, scenario_args['r3_lb'])
-    df = r4_filter_include_for_production_over(df, scenario_args['r4_lb'])
-    df = r5_filter_for_ami_net_export(df, scenario_args['r5_lb'])
-    #df = r6_filter_for_neighborhood_net_export_to_peak_load(df,  scenario_args['r6_lb'])
+# Scenarios over rules r1-r5, each of the scenario_args is a lower bound or a range of lower bounds
+def scenario(df: pl.DataFrame, scenario_args: dict) -> pl.DataFrame:
+    rules = [Rule('r1_lb', pl.col('res_pen_pers'), '>', scenario_args['r1_lb']),
+             Rule('r2_lb', pl.col('ami_cnt'), '>', scenario_args['r2_lb']),
+             Rule('r3_lb', pl.col('ami_prod_cnt'), '>', scenario_args['r3_lb']),
+             Rule('r4_lb', pl.col('p_prod_max'), '>', scenario_args['r4_lb']),
+             Rule('r5_lb', pl.col('net_export_max'), '>', scenario_args['r5_lb'])]
+    return evaluate(df, rules)
+
 
-    # solve some statistics
-    return {'number_of_neighborhoods'}
+# Rules 1-3 of reduction_path_5 as union over ranges of limits
+def reduction_path_5_scenarios(df: pl.DataFrame, limits_r1: list, limits_r2: list, limits_r3: list) -> pl.DataFrame:
+    df = df.filter(pl.col('ami_load_cnt')>0 ).filter(pl.col('ami_prod_cnt')>0)
+    rules = [Rule('limit_r1', pl.col('nb_aggmaxp_val'), '>', limits_r1),
+             Rule('limit_r2', (pl.col('nb_aggmaxl_val')-pl.col('nb_aggavgl_val'))/pl.col('nb_aggavgl_val'), '>', limits_r2),
+             Rule('limit_r3', (pl.col('nb_aggmaxp_val')/pl.col('nb_aggmaxl_val'))*((pl.col('nb_aggmaxl_idx')-pl.col('nb_aggmaxp_idx')).abs()/24).exp(), '>', limits_r3)]
+    return evaluate(df, rules, combine='any')
 
 
 def print_df(df: pl.DataFrame, sort_by: str='ami_cnt', n:int=10):
@@ -190,8 +199,7 @@ def reduction_path_5(df):
     df_r2 = df.filter((pl.col('nb_aggmaxl_val')-pl.col('nb_aggavgl_val'))/pl.col('nb_aggavgl_val')>limit_r2)
     print(f"[reduction_path_5]: Rule 2 -> {df_r2.n_unique('topology')}")
 
-    df.with_columns()
-    df_r3 = df.with_columns( ((pl.col('nb_aggmaxl_idx')-pl.col('nb_aggmaxp_idx')).abs().map_elements(lambda dt: np.power(np.e,dt/24)).alias('pow_e_dt')))
+    df_r3 = df.with_columns( ((pl.col('nb_aggmaxl_idx')-pl.col('nb_aggmaxp_idx')).abs()/24).exp().alias('pow_e_dt'))
     df_r3 = df_r3.with_columns( ((pl.col('nb_aggmaxp_val')/pl.col('nb_aggmaxl_val'))*pl.col('pow_e_dt')).alias('rule_3'))
     df_r3 = df_r3.filter( (pl.col('nb_aggmaxp_val')/pl.col('nb_aggmaxl_val'))*pl.col('pow_e_dt') > limit_r3 ).drop(columns=['pow_e_dt','rule_3'])
     print(f"[reduction_path_5]: Rule 3 -> {df_r3.n_unique('topology')}")
@@ -201,12 +209,14 @@ def reduction_path_5(df):
     return df_.unique(subset='topology')
 
 def assoc_ami_list(df):
+    topology_catalog = catalog()
+    topologies = df.select(pl.col('topology')).to_series().to_list()
+    if topology_catalog is not None:
+        return {topology: topology_catalog.meters.get(topology, []) for topology in topologies}
+
+    # without a catalog the meters are read from silver
     path = f"{PATH}/../../data/silver/"
-    topology_family = {}
-    for topology in df.select(pl.col('topology')).to_series().to_list():
-        df_ = pl.read_parquet(os.path.join(path, topology))
-        topology_family[topology] = df_.unique(subset='meteringPointId').select('meteringPointId').to_series().to_list()
-    return topology_family
+    return {topology: pl.read_parquet(os.path.join(path, topology), columns=['meteringPointId']).unique().to_series().to_list() for topology in topologies}
 
 
 if __name__ == "__main__":
@@ -6,7 +6,10 @@ PATH = os.path.dirname(__file__)
 if __name__ == "__main__":
     from_time = '2023-03-01'
     to_time = '2023-09-02'
-    file_path = os.path.join(PATH,f'../data/raw/price/euro_2_nok_valuta_{from_time}_{to_time}')
+    # the price directory of the data lake read by lib/valuation.py
+    price_path = os.path.join(PATH, '../../data/raw/price')
+    os.makedirs(price_path, exist_ok=True)
+    file_path = os.path.join(price_path, f'euro_2_nok_valuta_{from_time}_{to_time}')
 
     url = f'https://data.norges-bank.no/api/data/EXR/B.EUR.NOK.SP?format=sdmx-json&startPeriod={from_time}&endPeriod={to_time}&locale=no'
     response = requests.get(url)
@@ -0,0 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests, argparse, time
+
+
+# routes exercised for a topology and one of its meters
+def routes(topology: str, ami: str) -> dict:
+    return {'features': f"/features?sort_by=ami_prod_cnt&descending=1&show_n=200",
+            'features_json': f"/features?sort_by=ami_prod_cnt&descending=1&show_n=200&format=json",
+            'plot_raw': f"/plot/raw?topology={topology}&ami={ami}",
+            'plot_processed': f"/plot/processed?topology={topology}&every=1h",
+            'plot_processed_1d': f"/plot/processed?topology={topology}&every=1d",
+            'plot_duckcurve': f"/plot/duckcurve?topology={topology}",
+            'api_processed': f"/api/processed?topology={topology}&every=1h",
+            'api_raw': f"/api/raw?topology={topology}&ami={ami}"}
+
+
+def request(url: str) -> tuple:
+    t0 = time.perf_counter()
+    response = requests.get(url)
+    return time.perf_counter()-t0, response.status_code
+
+
+# python load_test.py --host http://0.0.0.0:9000 --concurrency 16 --requests 200
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load test of the web app reporting requests/sec and p95 latency per route')
+    parser.add_argument('--host', default='http://0.0.0.0:9000')
+    parser.add_argument('--concurrency', default=16, type=int)
+    parser.add_argument('--requests', default=200, type=int)
+    parser.add_argument('--topology', default=None)
+    args = parser.parse_args()
+
+    # default to the neighborhood with most production points and its first meter
+    topology = args.topology
+    if topology is None:
+        topology = requests.get(f"{args.host}/features?sort_by=ami_prod_cnt&descending=1&show_n=1&columns=topology&format=json").json()['topology'][0]
+    ami = requests.get(f"{args.host}/api/raw?topology={topology}").json()['meteringPointId'][0]
+
+    print(f"{'route':<20}{'req/s':>10}{'p50 [ms]':>12}{'p95 [ms]':>12}{'errors':>8}")
+    for name, route in routes(topology, ami).items():
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(request, [args.host+route]*args.requests))
+        elapsed = time.perf_counter()-t0
+
+        latency = np.array([result[0] for result in results])*1000
+        errors = sum(1 for result in results if result[1] != 200)
+        print(f"{name:<20}{args.requests/elapsed:>10.1f}{np.percentile(latency, 50):>12.1f}{np.percentile(latency, 95):>12.1f}{errors:>8}")
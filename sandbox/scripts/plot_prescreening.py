@@ -1,8 +1,9 @@
 import polars as pl
-import pandas as pd
 import os
 import numpy as np
 
+from lib.sweep import threshold_surface
+
 PATH = os.path.dirname(__file__)
 
 def plot():
@@ -13,12 +14,10 @@ def plot():
                                 df_pl.select(pl.col('ami_prod_cnt').max()).item(),
                                 df_pl.select(pl.col('ami_prod_cnt').max()).item()+1)
 
-    df_pd = pd.DataFrame(columns=['prod_ami_cnt','topology_cnt'])
-
-    for prod_ami_cnt in prod_cnt_list:
-        topology_cnt = df_pl.filter(pl.col('ami_prod_cnt')>=prod_ami_cnt).n_unique('topology')
-        df_pd.loc[len(df_pd.index)] = [prod_ami_cnt,topology_cnt]
-    print('')
+    # number of neighborhoods per production point threshold, constant second axis passed by every neighborhood
+    df_pd = threshold_surface(df_pl.with_columns(pl.lit(0).alias('all')), x='ami_prod_cnt', y='all', x_thresholds=prod_cnt_list, y_thresholds=[0]) \
+        .select(pl.col('ami_prod_cnt').alias('prod_ami_cnt'), pl.col('nb_cnt').alias('topology_cnt')).to_pandas()
+    print(df_pd)
 
 if __name__ == "__main__":
-    plot()
\ No newline at end of file
+    plot()
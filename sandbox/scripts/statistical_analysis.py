@@ -1,33 +1,23 @@
 import polars as pl
+import numpy as np
 import os
 import plotly.express as px
 
+from lib.profiles import profile_matrix
+
 PATH = os.getcwd()
 path = f"{PATH}/../../data/silver/"
 
 if __name__ == "__main__":
     topology = 'S_1262876_T_1262881'
-    df = pl.read_parquet(os.path.join(path, topology))
-
-    df = df.with_columns((pl.col('fromTime').map_elements(lambda datetime: datetime.hour)).alias('hour'))
-
-    meter_id_list = df.unique(subset='meteringPointId').select('meteringPointId').to_series().to_list()
+    df = pl.read_parquet(os.path.join(path, topology)).with_columns(topology=pl.lit(topology))
 
-    for index, meter_id in enumerate(meter_id_list):
-        df_ = df.filter(pl.col('meteringPointId') == meter_id)
+    # mean hourly net load of every meter in one pass
+    df_meters, matrix = profile_matrix(df, period='day', value=pl.col('p_load_kwh')-pl.col('p_prod_kwh'), normalize=None)
 
-        df_=df_.group_by(by='hour').agg(pl.col('p_load_kwh').mean().alias('p_load_max_kwh'),
-                                       pl.col('p_prod_kwh').mean().alias('p_prod_max_kwh')
-                                       ).sort(by='hour')
-        df_=df_.with_columns((pl.col('p_load_max_kwh')-pl.col('p_prod_max_kwh')).alias('p_net_max_kwh'))
-
-        if index==0:
-            fig = px.line(x=df_['hour'], y=df_['p_net_max_kwh'])
-        else:
-            fig.add_scatter(x=df_['hour'], y=df_['p_net_max_kwh'])
-        fig.data[index].showlegend = True
-        fig.data[index].name =  f"[{index}] {meter_id}"
+    df_ = pl.DataFrame({'hour': np.tile(np.arange(matrix.shape[1]), matrix.shape[0]),
+                        'p_net_max_kwh': matrix.ravel(),
+                        'meter': [f"[{index}] {meter_id}" for index, meter_id in enumerate(df_meters['meteringPointId']) for _ in range(matrix.shape[1])]})
 
+    fig = px.line(df_.to_pandas(), x='hour', y='p_net_max_kwh', color='meter')
     fig.show()
-
-
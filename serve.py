@@ -0,0 +1,52 @@
+from gunicorn.app.base import BaseApplication
+import argparse, multiprocessing, tempfile, os
+
+from lib.queries import preload
+from lib.cache import SILVER_CACHE_ENTRIES
+import lib.metrics
+from main import app
+
+
+# gunicorn application serving the flask app with the data tables preloaded in the master process,
+# forked workers share the preloaded tables copy-on-write
+class Server(BaseApplication):
+
+    def __init__(self, application, options: dict):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+# python serve.py --workers 8 --threads 2
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Production server for the AMI measurement web app')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', default=9000, type=int)
+    parser.add_argument('--workers', default=multiprocessing.cpu_count()+1, type=int)
+    parser.add_argument('--threads', default=2, type=int)
+    parser.add_argument('--timeout', default=300, type=int)
+    parser.add_argument('--preload-silver', default=SILVER_CACHE_ENTRIES, type=int, help='number of silver topologies to preload')
+    parser.add_argument('--metrics-path', default=lib.metrics.METRICS_PATH, help='directory of the worker metrics merged by /metrics, emptied at start, a fresh temporary directory by default')
+    args = parser.parse_args()
+
+    # /metrics merges the histogram snapshots of all workers, counts start over with the server
+    lib.metrics.METRICS_PATH = args.metrics_path or tempfile.mkdtemp(prefix='metrics_')
+    os.makedirs(lib.metrics.METRICS_PATH, exist_ok=True)
+    for file_name in os.listdir(lib.metrics.METRICS_PATH):
+        if file_name.endswith('.json'):
+            os.remove(os.path.join(lib.metrics.METRICS_PATH, file_name))
+
+    preload(silver_cnt=args.preload_silver)
+
+    Server(app, {'bind': f"{args.host}:{args.port}",
+                 'workers': args.workers,
+                 'threads': args.threads,
+                 'timeout': args.timeout,
+                 'preload_app': True}).run()